@@ -1,66 +1,27 @@
 """
 API Proxy for Cloud Probe Solution
 
-This script serves as a proxy to forward requests to the API server running on port 8000.
-It listens on port 5001 to avoid conflicts with Streamlit.
+Serves the API server on port 8000 and on port 5001 (kept for external
+clients, to avoid conflicts with Streamlit) from a single gunicorn instance,
+so requests on port 5001 no longer take an extra HTTP hop through a separate
+proxy process. Paths under /proxy are routed to the same API.
 """
 import os
-import requests
-from flask import Flask, request, jsonify, Response
+from werkzeug.middleware.dispatcher import DispatcherMiddleware
 
-# Create the Flask app
-app = Flask(__name__)
+from api_server import app
+from src.database import POOL_MAX_CONNECTIONS
 
-# Target API server
-API_SERVER = "http://localhost:8000"
-
-@app.route('/')
-def index():
-    """Proxy the root endpoint"""
-    try:
-        response = requests.get(f"{API_SERVER}/")
-        return Response(
-            response.content,
-            status=response.status_code,
-            content_type=response.headers.get('Content-Type', 'application/json')
-        )
-    except Exception as e:
-        return jsonify({"error": f"Proxy error: {str(e)}"}), 500
-
-@app.route('/api/health')
-def health_check():
-    """Proxy the health check endpoint"""
-    try:
-        response = requests.get(f"{API_SERVER}/api/health")
-        return Response(
-            response.content,
-            status=response.status_code,
-            content_type=response.headers.get('Content-Type', 'application/json')
-        )
-    except Exception as e:
-        return jsonify({"error": f"Proxy error: {str(e)}"}), 500
-
-@app.route('/api/probe/data', methods=['POST'])
-def receive_probe_data():
-    """Proxy the probe data endpoint"""
-    try:
-        # Forward the exact request content and headers
-        headers = {
-            'Content-Type': request.headers.get('Content-Type', 'application/xml')
-        }
-        response = requests.post(
-            f"{API_SERVER}/api/probe/data",
-            data=request.data,
-            headers=headers
-        )
-        return Response(
-            response.content,
-            status=response.status_code,
-            content_type=response.headers.get('Content-Type', 'application/json')
-        )
-    except Exception as e:
-        return jsonify({"error": f"Proxy error: {str(e)}"}), 500
+# One WSGI application for both ports
+application = DispatcherMiddleware(app, {'/proxy': app})
 
 if __name__ == '__main__':
-    port = int(os.environ.get("PROXY_PORT", 5001))
-    app.run(host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
+    api_port = int(os.environ.get("API_PORT", 8000))
+    proxy_port = int(os.environ.get("PROXY_PORT", 5001))
+    # Serve with gunicorn's threaded workers, listening on both ports; psycopg2
+    # blocks, so each request needs a thread of its own, and a worker's threads
+    # never outnumber its connection pool
+    os.execvp('gunicorn', [
+        'gunicorn', '-k', 'gthread', '-w', '4', '--threads', str(POOL_MAX_CONNECTIONS),
+        '-b', f'0.0.0.0:{api_port}', '-b', f'0.0.0.0:{proxy_port}', 'api_proxy:application'
+    ])
@@ -4,96 +4,130 @@ Provides endpoints to receive XML data from remote sources
 """
 import os
 import json
-import tempfile
+import time
 from datetime import datetime
 from typing import Dict, List, Optional, Union
 
 from flask import Flask, request, jsonify
-import xml.etree.ElementTree as ET
 
-from src.database import Database
+from src.database import Database, POOL_MAX_CONNECTIONS
 from src.xml_parser import XMLParser
-from src.data_validator import DataValidator
+from src.data_validator import validate_probe_data
+from src.json_provider import ORJSONProvider
 
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 db = Database()
 
+# Last formatted wall-clock second, shared by responses within the same second
+_timestamp_cache = {'second': None, 'iso': ''}
+
+def _now_iso() -> str:
+    """Current time as an ISO string, formatted at most once per second"""
+    second = int(time.time())
+    if _timestamp_cache['second'] != second:
+        _timestamp_cache['iso'] = datetime.fromtimestamp(second).isoformat()
+        _timestamp_cache['second'] = second
+    return _timestamp_cache['iso']
+
+# Request bodies up to this size are buffered and tried with the regex fast path;
+# larger ones are streamed through iterparse without buffering
+FAST_PATH_MAX_BYTES = 64 * 1024
+
+# The index response never changes, so it is encoded once at import
+INDEX_BODY = app.json.dumps({
+    "name": "Cloud Probe Solution API",
+    "version": "1.0.0",
+    "status": "running",
+    "endpoints": [
+        {
+            "path": "/api/probe/data",
+            "method": "POST",
+            "description": "Submit probe data as XML"
+        },
+        {
+            "path": "/api/health",
+            "method": "GET",
+            "description": "API health check"
+        }
+    ]
+})
+
 @app.route('/')
 def index():
-    return jsonify({
-        "name": "Cloud Probe Solution API",
-        "version": "1.0.0",
-        "status": "running",
-        "endpoints": [
-            {
-                "path": "/api/probe/data",
-                "method": "POST",
-                "description": "Submit probe data as XML"
-            },
-            {
-                "path": "/api/health",
-                "method": "GET",
-                "description": "API health check"
-            }
-        ]
-    })
+    response = app.response_class(INDEX_BODY, mimetype='application/json')
+    response.headers['Cache-Control'] = 'public, max-age=60'
+    response.add_etag()
+    return response.make_conditional(request)
 
 @app.route('/api/health')
 def health_check():
     """Simple health check endpoint"""
-    return jsonify({"status": "healthy", "timestamp": datetime.now().isoformat()})
+    response = jsonify({"status": "healthy", "timestamp": _now_iso()})
+    # Let pollers and intermediaries reuse the response for a second
+    response.headers['Cache-Control'] = 'public, max-age=1'
+    return response
+
+def probe_result(probe_data: Dict, is_valid: bool, errors: List[str], save_error: Optional[str],
+                 timestamp: str) -> Dict:
+    """Build the response entry for a single probe"""
+    if not is_valid:
+        return {
+            "probe": probe_data.get("address", ""),
+            "status": "validation_error",
+            "errors": errors
+        }
+    if save_error is not None:
+        return {
+            "probe": probe_data.get("address", ""),
+            "status": "error",
+            "error": save_error
+        }
+    return {
+        "probe": probe_data.get("address", ""),
+        "status": "success",
+        "timestamp": timestamp
+    }
 
 @app.route('/api/probe/data', methods=['POST'])
 def receive_probe_data():
     """Endpoint to receive probe data as XML"""
-    if not request.data:
+    if request.content_length == 0:
         return jsonify({"error": "No data received"}), 400
     
     try:
-        # Process XML data
-        xml_data = request.data.decode('utf-8')
-        
-        # Save XML to a temporary file for processing
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.xml') as tmp_file:
-            tmp_file.write(xml_data.encode('utf-8'))
-            tmp_path = tmp_file.name
-        
-        # Use the existing XML parser to process the file
-        probe_data_list = XMLParser.parse_xml_file(tmp_path)
-        
-        # Clean up the temporary file
-        os.unlink(tmp_path)
+        if request.content_length is not None and request.content_length <= FAST_PATH_MAX_BYTES:
+            # Small bodies are read whole; the regex fast path covers the usual
+            # flat layout and lxml handles the rest
+            data = request.get_data(cache=False)
+            probe_data_list = XMLParser.parse_xml_fast(data)
+            if probe_data_list is None:
+                probe_data_list = XMLParser.parse_xml_bytes(data)
+        else:
+            # Large or chunked bodies are parsed as they arrive from the socket
+            probe_data_list = XMLParser.parse_xml_stream(request.stream)
         
         if not probe_data_list:
             return jsonify({"error": "Failed to parse XML data"}), 400
         
-        # Validate and save all probe data
-        results = []
-        for probe_data in probe_data_list:
-            # Validate the data
-            is_valid, errors = DataValidator.validate_probe_data(probe_data)
-            
-            if is_valid:
-                # Save to database
-                try:
-                    db.save_measurement(probe_data)
-                    results.append({
-                        "probe": probe_data.get("address", ""),
-                        "status": "success",
-                        "timestamp": datetime.now().isoformat()
-                    })
-                except Exception as e:
-                    results.append({
-                        "probe": probe_data.get("address", ""),
-                        "status": "error",
-                        "error": str(e)
-                    })
-            else:
-                results.append({
-                    "probe": probe_data.get("address", ""),
-                    "status": "validation_error",
-                    "errors": errors
-                })
+        # Validate all probe data first, then save the valid readings in one batch
+        validated = [(probe_data, *validate_probe_data(probe_data))
+                     for probe_data in probe_data_list]
+        valid_rows = [probe_data for probe_data, is_valid, _ in validated if is_valid]
+        
+        save_errors = [None] * len(valid_rows)
+        try:
+            db.save_measurements_bulk(valid_rows)
+        except Exception:
+            # One bad reading fails the whole batch; save them one at a time
+            # so only the failing readings are reported
+            save_errors = db.save_measurements_each(valid_rows)
+        
+        timestamp = _now_iso()
+        valid_save_errors = iter(save_errors)
+        results = [probe_result(probe_data, is_valid, errors,
+                                next(valid_save_errors) if is_valid else None, timestamp)
+                   for probe_data, is_valid, errors in validated]
         
         return jsonify({
             "processed": len(probe_data_list),
@@ -105,4 +139,10 @@ def receive_probe_data():
 
 if __name__ == '__main__':
     port = int(os.environ.get("API_PORT", 8000))
-    app.run(host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
+    # Serve with gunicorn's threaded workers instead of Flask's development server;
+    # psycopg2 blocks, so each request needs a thread of its own, and a worker's
+    # threads never outnumber its connection pool
+    os.execvp('gunicorn', [
+        'gunicorn', '-k', 'gthread', '-w', '4', '--threads', str(POOL_MAX_CONNECTIONS),
+        '-b', f'0.0.0.0:{port}', 'api_server:app'
+    ])
\ No newline at end of file
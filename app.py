@@ -4,9 +4,12 @@ import os
 import requests
 from io import BytesIO
 import json
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from src.xml_parser import XMLParser
-from src.data_validator import DataValidator
+from src.data_validator import validate_probe_data
 from src.database import Database
+from src.importer import apply_defaults, process_file
 from src.ui_components import (
     render_header,
     render_probe_info,
@@ -22,36 +25,185 @@ XML_FILES = [
     "attached_assets/S1-C22-S12-20250227095512.XML"
 ]
 
-# Additional timestamp files
-TIMESTAMP_FILES = []
-for file in os.listdir("attached_assets"):
-    if file.lower().endswith(".xml") and " - " in file:
-        TIMESTAMP_FILES.append(os.path.join("attached_assets", file))
-
 # Add the alisonic_probes.xml file which contains probe 012345
 ALISONIC_FILE = "attached_assets/alisonic_probes.xml"
 if os.path.exists(ALISONIC_FILE):
     XML_FILES.append(ALISONIC_FILE)
 
+def format_site_name(path):
+    filename = path.split('/')[-1]
+    if "alisonic" in path.lower():
+        return "Site alisonic_probes (012345)"
+    elif "-" in filename:
+        # For S1-C435-S1531-XXXXXXXX.XML format
+        parts = filename.split('-')
+        if len(parts) >= 3:
+            return f"Site {parts[1]}-{parts[2]}"
+        else:
+            return filename
+    else:
+        return filename
+
+# Site labels for the selector, computed once since XML_FILES does not change
+XML_FILE_LABELS = [format_site_name(path) for path in XML_FILES]
+
+# Additional timestamp files, scanned at most once a minute instead of on every rerun
+@st.cache_data(ttl=60, show_spinner=False)
+def find_timestamp_files():
+    return [
+        entry.path for entry in os.scandir("attached_assets")
+        # Name checks first; is_file() uses the type cached in the directory entry
+        if " - " in entry.name and entry.name.lower().endswith(".xml") and entry.is_file()
+    ]
+
+# Number of validated rows written per bulk insert during the historical import
+IMPORT_BATCH_SIZE = 5_000
+
+# Files processed between progress bar updates during the historical import
+PROGRESS_UPDATE_EVERY = 10
+
+# Number of (address, datetime) keys remembered per session to skip re-saving
+SEEN_KEYS_LIMIT = 10_000
+
 # Initialize database connection using Streamlit's cache
-@st.cache_resource(ttl=300)  # Cache expires after 5 minutes to refresh connection
+@st.cache_resource  # Pooled connections are validated on checkout, so no expiry is needed
 def get_database():
     try:
-        # Set up a new database connection
+        # Set up the shared connection pool
         db = Database()
         return db
     except Exception as e:
         st.error(f"Failed to initialize database: {str(e)}")
         return None
 
+# Parsed XML is cached per file modification time, so auto-refresh reruns
+# only re-parse a file after it has been rewritten; entries for files that are
+# no longer viewed (or superseded mtimes) expire after 5 minutes
+@st.cache_data(ttl=300, show_spinner=False, max_entries=32)
+def parse_xml_cached(path: str, mtime: float):
+    return XMLParser.parse_xml_file(path)
+
+def load_probe_data_list(path: str):
+    """Return the parsed probes for path, reusing this session's last parse
+    while the file is unchanged instead of copying it out of the cache again.
+    Also keeps st.session_state.probe_addresses and probe_address_index
+    (address -> list index) in step with the parsed list."""
+    mtime = os.path.getmtime(path)
+    last_parsed = st.session_state.get('last_parsed_xml')
+    if last_parsed is not None and last_parsed[:2] == (path, mtime):
+        return last_parsed[2]
+    probe_data_list = parse_xml_cached(path, mtime)
+    st.session_state.last_parsed_xml = (path, mtime, probe_data_list)
+
+    probe_addresses = [probe['address'] for probe in probe_data_list or []]
+    # First occurrence wins, as with list.index
+    probe_address_index = {}
+    for i, address in enumerate(probe_addresses):
+        probe_address_index.setdefault(address, i)
+    st.session_state.probe_addresses = probe_addresses
+    st.session_state.probe_address_index = probe_address_index
+    return probe_data_list
+
+# A page of history is shared by reruns within the TTL. last_update is part of
+# the cache key, so a newly received measurement invalidates it at once
+@st.cache_data(ttl=10, show_spinner=False)
+def get_history_page(probe_id: str, cursor, per_page: int, last_update):
+    return get_database().get_measurement_history(
+        probe_id=probe_id,
+        per_page=per_page,
+        cursor=cursor
+    )
+
 def select_probe_callback(probe_address):
     """Callback for when a probe is selected from the summary view"""
-    probe_addresses = [probe['address'] for probe in st.session_state.probe_data_list]
-    if probe_address in probe_addresses:
-        st.session_state.selected_probe_index = probe_addresses.index(probe_address)
+    probe_address_index = st.session_state.get('probe_address_index', {})
+    if probe_address in probe_address_index:
+        st.session_state.selected_probe_index = probe_address_index[probe_address]
         st.session_state.show_probe_details = True
         st.rerun()
 
+def render_live_view(db, selected_xml, selected_probe):
+    """Refresh the selected probe's data and render the summary or detail view"""
+    # Parse XML from selected file
+    probe_data_list = load_probe_data_list(selected_xml)
+
+    if probe_data_list is None or len(probe_data_list) == 0:
+        st.error("Error parsing XML data. Please check the data source.")
+        return
+    st.session_state.probe_data_list = probe_data_list
+
+    # Get the selected probe data
+    probe_data = apply_defaults(probe_data_list[min(st.session_state.selected_probe_index, len(probe_data_list)-1)])
+
+    # Validate data; validate_probe_data memoizes repeated readings itself
+    is_valid, errors = validate_probe_data(probe_data)
+
+    if not is_valid:
+        render_error_messages(errors)
+        return
+
+    # Update last fetch time
+    st.session_state.last_update_time = probe_data['datetime']
+
+    # Save measurement to database, unless this reading was already saved
+    # during this session
+    key = (probe_data['address'], probe_data['datetime'])
+    seen_keys = st.session_state.setdefault('seen_keys', OrderedDict())
+    if key in seen_keys:
+        seen_keys.move_to_end(key)
+    elif db is not None:
+        # The insert skips readings that are already stored; a reading that
+        # failed to save is not remembered, so the next refresh tries again
+        if db.save_measurement(probe_data) is not None:
+            seen_keys[key] = None
+            if len(seen_keys) > SEEN_KEYS_LIMIT:
+                seen_keys.popitem(last=False)
+
+    # Show either summary or detailed view
+    if not st.session_state.show_probe_details:
+        # Render summary dashboard
+        render_probe_summary(probe_data_list, select_probe_callback)
+    else:
+        # Render detailed probe view
+        if st.button("Back to Summary"):
+            st.session_state.show_probe_details = False
+            st.rerun()
+
+        render_probe_info(probe_data)
+        render_measurements(probe_data)
+
+        # Fetch and display measurement history for selected probe
+        try:
+            if db is not None:
+                # Add debug information
+                st.info(f"Getting measurement history for probe: {selected_probe}")
+                
+                # history_cursors holds the cursor of every page before the current one
+                history_cursors = st.session_state.history_cursors
+                records, next_cursor = get_history_page(
+                    selected_probe,
+                    history_cursors[-1] if history_cursors else None,
+                    10,
+                    st.session_state.last_update_time
+                )
+                
+                # Debug information about records
+                st.info(f"Found {len(records)} records on this page")
+                
+                if records or history_cursors:
+                    render_measurement_history(records, next_cursor, len(history_cursors) + 1)
+                else:
+                    st.warning("No measurement history found for this probe. Try importing more data files or check the probe address.")
+            else:
+                st.warning("Database connection is not available. Unable to show measurement history.")
+        except Exception as e:
+            st.warning(f"Could not retrieve measurement history: {str(e)}")
+
+def render_status():
+    """Show when the displayed data was last updated"""
+    st.markdown("### Status")
+    st.text(f"Last update: {st.session_state.last_update_time}")
+
 def main():
     # Page config
     st.set_page_config(
@@ -63,8 +215,8 @@ def main():
     # Initialize session state
     if 'last_update_time' not in st.session_state:
         st.session_state.last_update_time = None
-    if 'history_page' not in st.session_state:
-        st.session_state.history_page = 1
+    if 'history_cursors' not in st.session_state:
+        st.session_state.history_cursors = []
     if 'selected_probe_index' not in st.session_state:
         st.session_state.selected_probe_index = 0
     if 'selected_xml_index' not in st.session_state:
@@ -91,82 +243,81 @@ def main():
                                value=3)
                                
         st.markdown("### Site Selection")
-        def format_site_name(path):
-            filename = path.split('/')[-1]
-            if "alisonic" in path.lower():
-                return "Site alisonic_probes (012345)"
-            elif "-" in filename:
-                # For S1-C435-S1531-XXXXXXXX.XML format
-                parts = filename.split('-')
-                if len(parts) >= 3:
-                    return f"Site {parts[1]}-{parts[2]}"
-                else:
-                    return filename
-            else:
-                return filename
-
-        selected_xml = st.selectbox(
+        st.session_state.selected_xml_index = st.selectbox(
             "Select Site XML",
-            XML_FILES,
+            range(len(XML_FILES)),
             index=min(st.session_state.selected_xml_index, len(XML_FILES)-1),
-            format_func=format_site_name
+            format_func=XML_FILE_LABELS.__getitem__
         )
-        st.session_state.selected_xml_index = XML_FILES.index(selected_xml)
+        selected_xml = XML_FILES[st.session_state.selected_xml_index]
         
         # Import timestamp files and offer an import button
         if 'timestamp_files_imported' not in st.session_state:
             st.session_state.timestamp_files_imported = False
             
         if not st.session_state.timestamp_files_imported:
+            timestamp_files = find_timestamp_files()
             import_btn = st.sidebar.button("Import Historical Data", type="primary", help="Import historical data from XML files")
             
-            if import_btn or (TIMESTAMP_FILES and 'auto_import' not in st.session_state):
+            if import_btn or (timestamp_files and 'auto_import' not in st.session_state):
                 st.session_state.auto_import = True
                 with st.sidebar:
                     progress_bar = st.progress(0.0)
                     status_text = st.empty()
                 
-                total_files = len(TIMESTAMP_FILES)
+                total_files = len(timestamp_files)
                 imported_count = 0
                 skipped_count = 0
                 success_count = 0
+                batch = []
+                save_errors = []
                 
-                for i, file_path in enumerate(TIMESTAMP_FILES):
-                    progress = (i / total_files)
-                    progress_bar.progress(progress)
-                    status_text.text(f"Importing file {i+1}/{total_files}: {os.path.basename(file_path)}")
-                    
-                    probe_data_list = XMLParser.parse_xml_file(file_path)
-                    if probe_data_list:
-                        for probe_data in probe_data_list:
-                            # Make sure discriminator is never empty
-                            if not probe_data.get('discriminator'):
-                                probe_data['discriminator'] = 'N'
-                                
-                            # Ensure customer_id and site_id values are valid
-                            if not probe_data.get('customer_id') or probe_data.get('customer_id') == '':
-                                probe_data['customer_id'] = '999'
-                                
-                            if not probe_data.get('site_id') or probe_data.get('site_id') == '':
-                                probe_data['site_id'] = '999'
-                            
-                            imported_count += 1
-                            is_valid, _ = DataValidator.validate_probe_data(probe_data)
-                            if is_valid:
-                                try:
-                                    db.save_measurement(probe_data)
-                                    success_count += 1
-                                except Exception as e:
-                                    skipped_count += 1
+                def flush_batch():
+                    nonlocal success_count, skipped_count
+                    try:
+                        db.save_measurements_bulk(batch)
+                        success_count += len(batch)
+                    except Exception:
+                        # One bad reading fails the whole batch; save the rows one
+                        # at a time so only the failing ones are skipped
+                        errors = [error for error in db.save_measurements_each(batch) if error is not None]
+                        success_count += len(batch) - len(errors)
+                        skipped_count += len(errors)
+                        save_errors.extend(errors)
+                    batch.clear()
+                
+                # Parse and validate files in parallel; only the main process writes to the database
+                workers = os.cpu_count() or 1
+                # About four chunks per worker keeps the tail balanced while
+                # amortizing the inter-process round trips on large imports
+                chunksize = max(1, total_files // (workers * 4))
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    results = executor.map(process_file, timestamp_files, chunksize=chunksize)
+                    for i, (probe_count, valid_rows) in enumerate(results):
+                        if i % PROGRESS_UPDATE_EVERY == 0:
+                            progress_bar.progress(i / total_files)
+                            status_text.text(f"Importing file {i+1}/{total_files}: {os.path.basename(timestamp_files[i])}")
+                        imported_count += probe_count
+                        batch.extend(valid_rows)
+                        if len(batch) >= IMPORT_BATCH_SIZE:
+                            flush_batch()
+                
+                flush_batch()
                 
                 progress_bar.progress(1.0)
                 status_text.text(f"Done! Imported {success_count}/{imported_count} measurements, skipped {skipped_count}")
+                if save_errors:
+                    # Kept across the rerun so the reason stays visible
+                    st.session_state.import_error = (f"Skipped {len(save_errors)} measurements "
+                                                     f"that could not be saved: {save_errors[0]}")
                 time.sleep(1)
                 st.session_state.timestamp_files_imported = True
                 st.rerun()
+        elif 'import_error' in st.session_state:
+            st.warning(st.session_state.import_error)
     
     # Parse XML from selected file
-    probe_data_list = XMLParser.parse_xml_file(selected_xml)
+    probe_data_list = load_probe_data_list(selected_xml)
     st.session_state.probe_data_list = probe_data_list
 
     if probe_data_list is None or len(probe_data_list) == 0:
@@ -178,93 +329,25 @@ def main():
     # Add probe selector to sidebar
     with st.sidebar:
         st.markdown("### Probe Selection")
-        probe_addresses = [probe['address'] for probe in probe_data_list]
         selected_probe = st.selectbox(
             "Select Probe",
-            probe_addresses,
+            st.session_state.probe_addresses,
             index=st.session_state.selected_probe_index
         )
-        st.session_state.selected_probe_index = probe_addresses.index(selected_probe)
+        st.session_state.selected_probe_index = st.session_state.probe_address_index[selected_probe]
 
-    # Get the selected probe data
-    probe_data = probe_data_list[st.session_state.selected_probe_index]
-    
-    # Make sure discriminator is never empty
-    if not probe_data.get('discriminator'):
-        probe_data['discriminator'] = 'N'
-        
-    # Ensure customer_id and site_id values are valid
-    if not probe_data.get('customer_id') or probe_data.get('customer_id') == '':
-        probe_data['customer_id'] = '999'
-        
-    if not probe_data.get('site_id') or probe_data.get('site_id') == '':
-        probe_data['site_id'] = '999'
+    # The history page cursors belong to one probe; start over on a new one
+    if st.session_state.get('history_probe') != selected_probe:
+        st.session_state.history_cursors = []
+        st.session_state.history_probe = selected_probe
 
-    # Validate data
-    is_valid, errors = DataValidator.validate_probe_data(probe_data)
-
-    if not is_valid:
-        render_error_messages(errors)
-        time.sleep(1)
-        st.rerun()
-        return
-
-    # Update last fetch time
-    st.session_state.last_update_time = probe_data['datetime']
-
-    # Save measurement to database
-    if db is not None:
-        try:
-            db.save_measurement(probe_data)
-        except Exception as e:
-            st.warning(f"Note: {str(e)}")
-            # Continue with the application even if saving fails
-
-    # Show either summary or detailed view
-    if not st.session_state.show_probe_details:
-        # Render summary dashboard
-        render_probe_summary(probe_data_list, select_probe_callback)
-    else:
-        # Render detailed probe view
-        if st.button("Back to Summary"):
-            st.session_state.show_probe_details = False
-            st.rerun()
-
-        render_probe_info(probe_data)
-        render_measurements(probe_data)
-
-        # Fetch and display measurement history for selected probe
-        try:
-            if db is not None:
-                # Add debug information
-                st.info(f"Getting measurement history for probe: {selected_probe}")
-                
-                records, total_records = db.get_measurement_history(
-                    probe_id=selected_probe,
-                    page=st.session_state.history_page,
-                    per_page=10
-                )
-                
-                # Debug information about records
-                st.info(f"Found {total_records} total records")
-                
-                if total_records > 0:
-                    render_measurement_history(records, total_records, st.session_state.history_page)
-                else:
-                    st.warning("No measurement history found for this probe. Try importing more data files or check the probe address.")
-            else:
-                st.warning("Database connection is not available. Unable to show measurement history.")
-        except Exception as e:
-            st.warning(f"Could not retrieve measurement history: {str(e)}")
+    # Only the live view and the status panel are re-executed on auto-refresh;
+    # the sidebar above is rebuilt only when the user interacts with it
+    st.fragment(render_live_view, run_every=refresh_rate)(db, selected_xml, selected_probe)
 
     # Display last update time
     with st.sidebar:
-        st.markdown("### Status")
-        st.text(f"Last update: {st.session_state.last_update_time}")
-
-    # Auto-refresh using Streamlit's native rerun
-    time.sleep(refresh_rate)
-    st.rerun()
+        st.fragment(render_status, run_every=refresh_rate)()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
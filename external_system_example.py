@@ -6,6 +6,8 @@ This demonstrates how an external system would send XML data
 to the API endpoint.
 """
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import argparse
 import sys
 import os
@@ -13,6 +15,12 @@ import os
 # Path to the XML file to send
 DEFAULT_XML_PATH = "attached_assets/S1-C435-S1531-20250227095734.XML"
 
+# Shared session so repeated sends reuse keep-alive connections
+_session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=10, pool_maxsize=10, max_retries=Retry(total=3))
+_session.mount('http://', _adapter)
+_session.mount('https://', _adapter)
+
 def send_probe_data(api_url, xml_file_path):
     """
     Send XML probe data to the API
@@ -27,13 +35,10 @@ def send_probe_data(api_url, xml_file_path):
     print(f"Sending data from {xml_file_path} to {api_url}")
     
     try:
-        # Read the XML file
-        with open(xml_file_path, 'r') as file:
-            xml_content = file.read()
-        
-        # Send the XML data to the API
+        # Stream the XML file as raw bytes; the API decodes it using the XML declaration
         headers = {'Content-Type': 'application/xml'}
-        response = requests.post(api_url, data=xml_content, headers=headers)
+        with open(xml_file_path, 'rb') as file:
+            response = _session.post(api_url, data=file, headers=headers)
         
         # Print response details
         print(f"Status code: {response.status_code}")
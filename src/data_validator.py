@@ -1,126 +1,168 @@
+import math
+from functools import lru_cache
 from datetime import datetime
-from typing import Dict, Tuple, List
+from typing import Dict, Tuple, List, Optional
 
-class DataValidator:
-    @staticmethod
-    def validate_probe_data(data: Dict) -> Tuple[bool, List[str]]:
-        errors = []
+VALID_DISCRIMINATORS = frozenset({'D', 'P', 'N', ''})
 
-        # ProbeStatus validation (max 2 digits) - support both 'probe_status' and 'status' fields
-        try:
-            # Try 'probe_status' first, then fall back to 'status'
-            probe_status_value = data.get('probe_status', data.get('status', '0'))
-            if probe_status_value == '':
-                probe_status_value = '0'
-                
-            probe_status = int(probe_status_value)
-            if probe_status < 0 or len(str(probe_status)) > 2:
-                errors.append("Probe status must be a positive number with max 2 digits")
-        except (ValueError, TypeError):
-            errors.append("Probe status must be a valid integer")
-
-        # AlarmStatus validation (0, 1, or 2)
-        try:
-            alarm_status_value = data.get('alarm_status', '0')
-            if alarm_status_value == '':
-                alarm_status_value = '0'
-                
-            alarm_status = int(alarm_status_value)
-            # Allow any numeric value for now, we'll normalize in the database
-            if alarm_status < 0:
-                errors.append("Alarm status must be a non-negative integer")
-        except (ValueError, TypeError):
-            # Default to 0 if there's a problem
-            pass
-
-        # TankStatus validation (max 2 digits)
-        try:
-            tank_status_value = data.get('tank_status', '0')
-            if tank_status_value == '':
-                tank_status_value = '0'
-                
-            tank_status = int(tank_status_value)
-            if tank_status < 0 or len(str(tank_status)) > 2:
-                errors.append("Tank status must be a positive number with max 2 digits")
-        except (ValueError, TypeError):
-            # Default to 0 if there's a problem
-            pass
-
-        # Ullage validation (5 integers + 2 decimals)
-        try:
-            ullage = float(data.get('ullage', '0.0'))
-            ullage_str = str(ullage)
-            int_part, dec_part = ullage_str.split('.')
-            if len(int_part) > 5 or len(dec_part) > 2:
-                errors.append("Ullage must have max 5 integers and 2 decimals")
-        except (ValueError, IndexError):
-            errors.append("Invalid ullage value")
-
-        # Product validation (5 integers + 2 decimals)
-        try:
-            product = float(data.get('product', '0.0'))
-            product_str = str(product)
-            int_part, dec_part = product_str.split('.')
-            if len(int_part) > 5 or len(dec_part) > 2:
-                errors.append("Product must have max 5 integers and 2 decimals")
-        except (ValueError, IndexError):
-            errors.append("Invalid product value")
-
-        # Water validation (5 integers + 2 decimals)
-        try:
-            water = float(data.get('water', '0.0'))
-            water_str = str(water)
-            int_part, dec_part = water_str.split('.')
-            if len(int_part) > 5 or len(dec_part) > 2:
-                errors.append("Water must have max 5 integers and 2 decimals")
-        except (ValueError, IndexError):
-            errors.append("Invalid water value")
-
-        # Density validation (4 integers + 2 decimals)
+# Fields read by validate_probe_data besides temperatures, and a marker for
+# absent ones, used to build the memoization key
+_VALIDATED_FIELDS = ('probe_status', 'status', 'alarm_status', 'tank_status', 'ullage',
+                     'product', 'water', 'density', 'discriminator', 'datetime')
+_MISSING = object()
+
+def _has_point(number: float) -> bool:
+    """Whether str(number) contains a decimal point; only values printed in
+    exponent form (below 1e-4 or from 1e16 up) need the string built"""
+    if not math.isfinite(number):
+        return False
+    return number == 0 or 1e-4 <= abs(number) < 1e16 or '.' in str(number)
+
+def _fits_digits(number: float, max_int: int, max_dec: int) -> bool:
+    """Whether str(number) has at most max_int integer characters (sign included)
+    and max_dec decimals, checked arithmetically instead of splitting the string"""
+    return -(10 ** (max_int - 1)) < number < 10 ** max_int and round(number, max_dec) == number
+
+def _check_decimal(data: Dict, key: str, label: str, max_int: int, max_dec: int,
+                   errors: List[str]):
+    """Append an error unless data[key] is a number within the digit limits"""
+    try:
+        number = float(data.get(key, '0.0'))
+        if not _has_point(number):
+            raise ValueError
+        if not _fits_digits(number, max_int, max_dec):
+            errors.append(f"{label} must have max {max_int} integers and {max_dec} decimals")
+    except ValueError:
+        errors.append(f"Invalid {key} value")
+
+def parse_datetime_fast(value: str) -> Optional[datetime]:
+    """Parse 'YYYY-MM-DD HH:MM:SS' (dots allowed between time components) by
+    slicing, returning None when the value needs the full strptime path"""
+    if not isinstance(value, str) or len(value) != 19 or not value.isascii():
+        return None
+    if value[4] != '-' or value[7] != '-' or value[10] != ' ' \
+            or value[13] not in ':.' or value[16] not in ':.':
+        return None
+    parts = (value[0:4], value[5:7], value[8:10], value[11:13], value[14:16], value[17:19])
+    if not all(part.isdigit() for part in parts):
+        return None
+    try:
+        return datetime(*map(int, parts))
+    except ValueError:
+        return None
+
+def _validate_probe_data(data: Dict) -> Tuple[bool, List[str]]:
+    errors = []
+
+    # ProbeStatus validation (max 2 digits) - support both 'probe_status' and 'status' fields
+    try:
+        # Try 'probe_status' first, then fall back to 'status'
+        probe_status_value = data.get('probe_status', data.get('status', '0'))
+        if probe_status_value == '':
+            probe_status_value = '0'
+            
+        probe_status = int(probe_status_value)
+        if probe_status < 0 or probe_status > 99:
+            errors.append("Probe status must be a positive number with max 2 digits")
+    except (ValueError, TypeError):
+        errors.append("Probe status must be a valid integer")
+
+    # AlarmStatus validation (0, 1, or 2)
+    try:
+        alarm_status_value = data.get('alarm_status', '0')
+        if alarm_status_value == '':
+            alarm_status_value = '0'
+            
+        alarm_status = int(alarm_status_value)
+        # Allow any numeric value for now, we'll normalize in the database
+        if alarm_status < 0:
+            errors.append("Alarm status must be a non-negative integer")
+    except (ValueError, TypeError):
+        # Default to 0 if there's a problem
+        pass
+
+    # TankStatus validation (max 2 digits)
+    try:
+        tank_status_value = data.get('tank_status', '0')
+        if tank_status_value == '':
+            tank_status_value = '0'
+            
+        tank_status = int(tank_status_value)
+        if tank_status < 0 or tank_status > 99:
+            errors.append("Tank status must be a positive number with max 2 digits")
+    except (ValueError, TypeError):
+        # Default to 0 if there's a problem
+        pass
+
+    # Level and density validation (5 integers + 2 decimals, density 4 + 2)
+    _check_decimal(data, 'ullage', 'Ullage', 5, 2, errors)
+    _check_decimal(data, 'product', 'Product', 5, 2, errors)
+    _check_decimal(data, 'water', 'Water', 5, 2, errors)
+    _check_decimal(data, 'density', 'Density', 4, 2, errors)
+
+    # Discriminator validation
+    discriminator = data.get('discriminator', 'N')
+    if not discriminator:  # Empty discriminator
+        discriminator = 'N'
+    
+    # Allow empty or standard values
+    if discriminator not in VALID_DISCRIMINATORS:
+        errors.append("Discriminator must be D, P, or N")
+
+    # DateTime validation
+    datetime_str = data.get('datetime', '')
+    if datetime_str and parse_datetime_fast(datetime_str) is None:
         try:
-            density = float(data.get('density', '0.0'))
-            density_str = str(density)
-            int_part, dec_part = density_str.split('.')
-            if len(int_part) > 4 or len(dec_part) > 2:
-                errors.append("Density must have max 4 integers and 2 decimals")
-        except (ValueError, IndexError):
-            errors.append("Invalid density value")
-
-        # Discriminator validation
-        discriminator = data.get('discriminator', 'N')
-        if not discriminator:  # Empty discriminator
-            discriminator = 'N'
-        
-        # Allow empty or standard values
-        if discriminator not in ['D', 'P', 'N', '']:
-            errors.append("Discriminator must be D, P, or N")
-
-        # DateTime validation
-        datetime_str = data.get('datetime', '')
-        if datetime_str:
+            # Try standard format first
+            datetime.strptime(datetime_str, '%Y-%m-%d %H:%M:%S')
+        except ValueError:
             try:
-                # Try standard format first
-                datetime.strptime(datetime_str, '%Y-%m-%d %H:%M:%S')
+                # Try with dots between time components
+                alt_datetime_str = datetime_str.replace('.', ':')
+                datetime.strptime(alt_datetime_str, '%Y-%m-%d %H:%M:%S')
             except ValueError:
-                try:
-                    # Try with dots between time components
-                    alt_datetime_str = datetime_str.replace('.', ':')
-                    datetime.strptime(alt_datetime_str, '%Y-%m-%d %H:%M:%S')
-                except ValueError:
-                    errors.append("Invalid datetime format. Expected format: YYYY-MM-DD HH:MM:SS")
-        else:
-            errors.append("Missing datetime value")
-
-        # Temperature validation (3 integers + 1 decimal, range -30° to 80°)
-        for temp in data.get('temperatures', []):
-            try:
-                temp_str = str(float(temp))
-                int_part, dec_part = temp_str.split('.')
-                if len(int_part) > 3 or len(dec_part) > 1:
-                    errors.append("Temperature must have max 3 integers and 1 decimal")
-                if float(temp) < -30 or float(temp) > 80:
-                    errors.append("Temperature must be between -30° and 80°")
-            except (ValueError, IndexError):
-                errors.append("Invalid temperature value")
-
-        return len(errors) == 0, errors
\ No newline at end of file
+                errors.append("Invalid datetime format. Expected format: YYYY-MM-DD HH:MM:SS")
+    elif not datetime_str:
+        errors.append("Missing datetime value")
+
+    # Temperature validation (3 integers + 1 decimal, range -30° to 80°)
+    for temp in data.get('temperatures', []):
+        try:
+            temp_value = float(temp)
+            if not _has_point(temp_value):
+                raise ValueError
+            if not _fits_digits(temp_value, 3, 1):
+                errors.append("Temperature must have max 3 integers and 1 decimal")
+            if temp_value < -30 or temp_value > 80:
+                errors.append("Temperature must be between -30° and 80°")
+        except ValueError:
+            errors.append("Invalid temperature value")
+
+    return len(errors) == 0, errors
+
+@lru_cache(maxsize=4096)
+def _validate_key(key: Tuple) -> Tuple[bool, Tuple[str, ...]]:
+    """Validate a reading rebuilt from its fingerprint; see validate_probe_data"""
+    *values, temperatures = key
+    data = {field: value for field, value in zip(_VALIDATED_FIELDS, values) if value is not _MISSING}
+    data['temperatures'] = temperatures
+    is_valid, errors = _validate_probe_data(data)
+    return is_valid, tuple(errors)
+
+def validate_probe_data(data: Dict) -> Tuple[bool, List[str]]:
+    """Validate one probe reading, returning whether it is valid and the errors found.
+
+    Results are memoized on the fields validation reads, since a steady tank
+    reports identical readings poll after poll. Readings with unhashable values
+    are validated directly.
+    """
+    try:
+        key = tuple(data.get(field, _MISSING) for field in _VALIDATED_FIELDS) \
+            + (tuple(data.get('temperatures', [])),)
+        is_valid, errors = _validate_key(key)
+    except TypeError:
+        return _validate_probe_data(data)
+    return is_valid, list(errors)
+
+class DataValidator:
+    validate_probe_data = staticmethod(validate_probe_data)
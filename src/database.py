@@ -1,15 +1,149 @@
+import csv
+from collections import namedtuple
+import functools
+import io
 import os
+import threading
 import time
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 import psycopg2
-from psycopg2.extras import RealDictCursor
-import json
+import psycopg2.errors
+import psycopg2.extensions
+from psycopg2.extras import RealDictCursor, execute_values
+from psycopg2.pool import PoolError, ThreadedConnectionPool
+import orjson
 from typing import List, Dict, Optional, Tuple
 import streamlit as st
 
+from src.data_validator import parse_datetime_fast
+
+MEASUREMENT_COLUMNS = ('probe_id, timestamp, status, product, water, density, discriminator, '
+                       'temperatures, probe_status, alarm_status, tank_status, ullage')
+
+# Connections held open by each process's pool. All of them are kept, since
+# each carries its prepared statements and staging table; every concurrent
+# Streamlit session or request thread holds one while querying, and further
+# ones wait up to POOL_WAIT_TIMEOUT seconds for a connection to be handed back
+POOL_MAX_CONNECTIONS = 16
+POOL_WAIT_TIMEOUT = 30
+
+# Seconds to wait for the server when opening a connection
+CONNECT_TIMEOUT = 5
+# Attempts made by _with_reconnect, and the pause before the first retry in
+# seconds, doubled after each further one
+RECONNECT_ATTEMPTS = 3
+RECONNECT_DELAY = 0.2
+
+# One row of measurement history, in the column order of get_measurement_history
+MeasurementRow = namedtuple('MeasurementRow', [
+    'timestamp', 'probe_address', 'status', 'product', 'water', 'density',
+    'discriminator', 'probe_status', 'alarm_status', 'tank_status', 'ullage'
+])
+
+# CHECK constraints mirroring validate_probe_data's value rules
+MEASUREMENT_CHECKS = {
+    'ck_measurements_discriminator': "discriminator IN ('D', 'P', 'N')",
+    'ck_measurements_status': 'probe_status BETWEEN 0 AND 99 AND tank_status BETWEEN 0 AND 99 AND alarm_status >= 0',
+}
+
+# Indexes built after the schema exists, grouped by table: index name -> definition
+SECONDARY_INDEXES = {
+    'measurements': {
+        'idx_measurements_timestamp': 'ON measurements(timestamp DESC)',
+        # Readings arrive in roughly timestamp order, so a BRIN index covers
+        # wide time ranges for a fraction of the b-tree's size
+        'idx_measurements_timestamp_brin': 'ON measurements USING BRIN (timestamp) WITH (pages_per_range = 32)',
+    },
+    'probes': {'idx_probes_address': 'ON probes(probe_address)'},
+    'sites': {'idx_sites_client': 'ON sites(client_id)'},
+}
+
+# Advisory lock key held by the transaction that creates and migrates the
+# tables, so the API workers and Streamlit apply each migration once
+SCHEMA_LOCK_KEY = 0x50524f41
+# Advisory lock key held while a process builds the secondary indexes, so the
+# API workers and Streamlit do not run the same builds at once
+INDEX_LOCK_KEY = 0x50524f42
+
+# Server-side prepared statements, created lazily on each pooled connection
+PREPARED_STATEMENTS = {
+    'save_measurement': '''
+        INSERT INTO measurements 
+        (probe_id, timestamp, status, product, water, density, discriminator, 
+         temperatures, probe_status, alarm_status, tank_status, ullage)
+        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12)
+        ON CONFLICT (probe_id, timestamp) DO NOTHING
+        RETURNING 1
+    ''',
+}
+
+def _connection_lost(error: psycopg2.OperationalError) -> bool:
+    """Whether an error means the connection is gone or could not be opened,
+    rather than a statement failing on a live one (e.g. a cancelled query)"""
+    if error.pgcode is not None:
+        # Class 57P: the server shut down or terminated the session
+        return error.pgcode.startswith('57P')
+    cursor = getattr(error, 'cursor', None)
+    return cursor is None or bool(cursor.connection.closed)
+
+def _with_reconnect(method):
+    """Retry a call whose connection was lost, e.g. after a server restart.
+
+    Other idle connections in the pool may have died along with it, so the
+    retries ping each connection they check out and replace the dead ones.
+    Attempts back off and are capped at RECONNECT_ATTEMPTS, so an outage fails
+    the call instead of hanging it. The wrapped calls must be safe to repeat;
+    writes skip stored rows.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            for attempt in range(RECONNECT_ATTEMPTS):
+                try:
+                    return method(self, *args, **kwargs)
+                except psycopg2.OperationalError as e:
+                    if attempt == RECONNECT_ATTEMPTS - 1 or not _connection_lost(e):
+                        raise
+                    time.sleep(RECONNECT_DELAY * 2 ** attempt)
+                    self._reconnecting.active = True
+        finally:
+            self._reconnecting.active = False
+    return wrapper
+
+class PooledConnection(psycopg2.extensions.connection):
+    """Connection that remembers which statements are prepared on its session.
+
+    The record lives on the connection itself, so a replacement connection
+    starts without one; if the server drops the statements of a connection
+    that stays open, _save_one prepares them again.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+    def prepare(self, cur, name: str):
+        """Prepare a statement from PREPARED_STATEMENTS unless this session already has it"""
+        if name not in self.prepared:
+            cur.execute(f"PREPARE {name} AS {PREPARED_STATEMENTS[name]}")
+            self.prepared.add(name)
+
 class Database:
+    # Set once the schema and indexes exist, so later pools in this process skip the DDL
+    _schema_ready = False
+
     def __init__(self):
-        self.conn = None
+        self.pool = None
+        # Probe address -> probe id; probes are never re-pointed once created,
+        # so entries stay valid unless rows are deleted outside the app
+        self._probe_ids: Dict[str, int] = {}
+        # The Database is shared by every Streamlit session thread
+        self._probe_ids_lock = threading.Lock()
+        # Set while _with_reconnect retries on this thread, so checkouts ping
+        self._reconnecting = threading.local()
+        # The pool raises instead of waiting when every connection is in use
+        self._free_connections = threading.BoundedSemaphore(POOL_MAX_CONNECTIONS)
         max_attempts = 3
         for attempt in range(max_attempts):
             try:
@@ -26,51 +160,86 @@ class Database:
                     raise
 
     def connect(self):
-        """Establish database connection"""
+        """Create the connection pool and initialize the schema"""
         try:
-            # Always close the old connection if it exists
-            if hasattr(self, 'conn') and self.conn is not None:
+            # Always close the old pool if it exists
+            if self.pool is not None:
                 try:
-                    self.conn.close()
+                    self.pool.closeall()
                 except:
                     pass  # Ignore errors on closing
                 
-            # Create a fresh connection
-            self.conn = psycopg2.connect(os.environ['DATABASE_URL'])
-            self.conn.autocommit = False  # Explicitly manage transactions
+            # Connections are opened up front and reused across calls; with
+            # minconn at the maximum, none is closed when handed back
+            self.pool = ThreadedConnectionPool(minconn=POOL_MAX_CONNECTIONS, maxconn=POOL_MAX_CONNECTIONS,
+                                               dsn=os.environ['DATABASE_URL'],
+                                               connect_timeout=CONNECT_TIMEOUT,
+                                               connection_factory=PooledConnection)
             
             # Initialize the database schema
-            self.create_tables()
+            if not Database._schema_ready:
+                with self.connection() as conn:
+                    self.create_tables(conn)
+                self.create_indexes()
+                Database._schema_ready = True
             return True
         except Exception as e:
-            if hasattr(self, 'conn') and self.conn is not None:
+            if self.pool is not None:
                 try:
-                    self.conn.close()
+                    self.pool.closeall()
                 except:
                     pass
-            self.conn = None
+            self.pool = None
             st.error(f"Database connection error: {str(e)}")
             raise
 
-    def ensure_connection(self):
-        """Ensure database connection is active"""
-        if self.conn is None or self.conn.closed:
-            return self.connect()
-            
-        # Test the connection
+    @contextmanager
+    def connection(self):
+        """Borrow a connection from the pool, replacing it if it has been closed.
+
+        Connections are not probed with a query up front; one that fails while
+        in use is discarded when handed back, and _with_reconnect retries the
+        call, pinging the connections it gets. The pool rolls back any
+        transaction left open. While every connection is in use, callers wait
+        for one to be handed back, raising PoolError after POOL_WAIT_TIMEOUT.
+        """
+        if not self._free_connections.acquire(timeout=POOL_WAIT_TIMEOUT):
+            raise PoolError(f"No database connection free after {POOL_WAIT_TIMEOUT} seconds")
         try:
-            with self.conn.cursor() as cur:
+            ping = getattr(self._reconnecting, 'active', False)
+            conn = self.pool.getconn()
+            # At most every pooled connection can have died
+            for _ in range(POOL_MAX_CONNECTIONS):
+                if not conn.closed and not (ping and not self._alive(conn)):
+                    break
+                self.pool.putconn(conn, close=True)
+                conn = self.pool.getconn()
+            try:
+                yield conn
+            finally:
+                self.pool.putconn(conn, close=bool(conn.closed))
+        finally:
+            self._free_connections.release()
+
+    @staticmethod
+    def _alive(conn) -> bool:
+        """Whether a round trip on the connection succeeds"""
+        try:
+            with conn.cursor() as cur:
                 cur.execute('SELECT 1')
-                cur.fetchone()
+            conn.rollback()
             return True
-        except Exception:
-            # Connection is broken, create a new one
-            return self.connect()
+        except psycopg2.Error:
+            return False
 
-    def create_tables(self):
+    def create_tables(self, conn):
         """Create database schema if it doesn't exist"""
         try:
-            with self.conn.cursor() as cur:
+            with conn.cursor() as cur:
+                # Wait for any other process setting up the schema; once it
+                # commits, the checks below find its migrations done
+                cur.execute('SELECT pg_advisory_xact_lock(%s)', (SCHEMA_LOCK_KEY,))
+
                 # Create tables if they don't exist
                 
                 # Create clients table
@@ -114,7 +283,7 @@ class Database:
                         water DECIMAL(7,2) NOT NULL,
                         density DECIMAL(6,2) NOT NULL,
                         discriminator CHAR(1) NOT NULL,
-                        temperatures JSON NOT NULL,
+                        temperatures JSONB NOT NULL,
                         probe_status INTEGER NOT NULL DEFAULT 0,
                         alarm_status INTEGER NOT NULL DEFAULT 0,
                         tank_status INTEGER NOT NULL DEFAULT 0,
@@ -123,254 +292,488 @@ class Database:
                     )
                 ''')
                 
-                # Create indexes for better query performance
-                cur.execute('CREATE INDEX IF NOT EXISTS idx_measurements_timestamp ON measurements(timestamp DESC)')
-                cur.execute('CREATE INDEX IF NOT EXISTS idx_measurements_probe_timestamp ON measurements(probe_id, timestamp)')
-                cur.execute('CREATE INDEX IF NOT EXISTS idx_probes_address ON probes(probe_address)')
-                cur.execute('CREATE INDEX IF NOT EXISTS idx_sites_client ON sites(client_id)')
+                # Value rules the validator enforces, checked again on insert; NOT VALID
+                # skips scanning readings stored before the constraints existed
+                for name, check in MEASUREMENT_CHECKS.items():
+                    cur.execute('SELECT 1 FROM pg_constraint WHERE conname = %s', (name,))
+                    if cur.fetchone() is None:
+                        cur.execute(f'ALTER TABLE measurements ADD CONSTRAINT {name} CHECK ({check}) NOT VALID')
 
-                # Insert default client and site if they don't exist
+                # Uniqueness backs ON CONFLICT, so it is created with the tables;
+                # the remaining indexes are built by create_indexes
+                cur.execute("SELECT to_regclass('uq_measurements_probe_timestamp')")
+                if cur.fetchone()[0] is None:
+                    # Drop duplicate readings stored before uniqueness was enforced
+                    cur.execute('''
+                        DELETE FROM measurements a
+                        USING measurements b
+                        WHERE a.probe_id = b.probe_id AND a.timestamp = b.timestamp AND a.id > b.id
+                    ''')
+                    cur.execute('CREATE UNIQUE INDEX uq_measurements_probe_timestamp ON measurements(probe_id, timestamp)')
+                    cur.execute('DROP INDEX IF EXISTS idx_measurements_probe_timestamp')
+
+                # Temperatures used to be stored as text JSON; convert them in place
                 cur.execute('''
-                    INSERT INTO clients (name)
-                    VALUES ('Default Client')
-                    ON CONFLICT (name) DO NOTHING
-                    RETURNING id
+                    SELECT 1 FROM information_schema.columns
+                    WHERE table_name = 'measurements' AND column_name = 'temperatures' AND data_type = 'json'
+                ''')
+                if cur.fetchone() is not None:
+                    cur.execute('ALTER TABLE measurements ALTER COLUMN temperatures TYPE JSONB USING temperatures::jsonb')
+
+                # Insert default client and site if they don't exist; the
+                # statement's snapshot only sees a pre-existing client, so exactly
+                # one of the two branches yields its id
+                cur.execute('''
+                    WITH new_client AS (
+                        INSERT INTO clients (name)
+                        VALUES ('Default Client')
+                        ON CONFLICT (name) DO NOTHING
+                        RETURNING id
+                    ), client AS (
+                        SELECT id FROM new_client
+                        UNION ALL
+                        SELECT id FROM clients WHERE name = 'Default Client'
+                    )
+                    INSERT INTO sites (client_id, name)
+                    SELECT id, 'Default Site' FROM client
+                    ON CONFLICT (client_id, name) DO NOTHING
                 ''')
-                result = cur.fetchone()
-                if result:
-                    client_id = result[0]
-                else:
-                    # Get the ID if the client already exists
-                    cur.execute("SELECT id FROM clients WHERE name = 'Default Client'")
-                    result = cur.fetchone()
-                    client_id = result[0] if result else None
-                
-                if client_id:
-                    cur.execute('''
-                        INSERT INTO sites (client_id, name)
-                        VALUES (%s, 'Default Site')
-                        ON CONFLICT (client_id, name) DO NOTHING
-                    ''', (client_id,))
 
-                self.conn.commit()
+                conn.commit()
                 return True
             
         except Exception as e:
-            self.conn.rollback()
+            conn.rollback()
             st.error(f"Error creating tables: {str(e)}")
             raise
 
-    def save_measurement(self, probe_data: Dict):
-        """Save a measurement to the database"""
-        try:
-            self.ensure_connection()
-            with self.conn.cursor() as cur:
-                # Get or create client based on customer_id
-                customer_id = probe_data.get('customer_id', '0')
-                customer_name = f"Customer {customer_id}"
-                
-                cur.execute('''
-                    INSERT INTO clients (name)
-                    VALUES (%s)
-                    ON CONFLICT (name) DO NOTHING
-                    RETURNING id
-                ''', (customer_name,))
-                
-                result = cur.fetchone()
-                if result:
-                    client_id = result[0]
-                else:
-                    cur.execute('SELECT id FROM clients WHERE name = %s', (customer_name,))
-                    result = cur.fetchone()
-                    client_id = result[0] if result else None
-
-                if not client_id:
-                    raise Exception(f"Failed to get or create client: {customer_name}")
+    def create_indexes(self):
+        """Build secondary indexes without blocking writes.
 
-                # Get or create site based on site_id and client_id
-                site_id = probe_data.get('site_id', '0')
-                site_name = f"Site {site_id}"
-                
-                cur.execute('''
-                    INSERT INTO sites (client_id, name)
-                    VALUES (%s, %s)
-                    ON CONFLICT (client_id, name) DO NOTHING
-                    RETURNING id
-                ''', (client_id, site_name))
-                
-                result = cur.fetchone()
-                if result:
-                    db_site_id = result[0]
-                else:
-                    cur.execute('SELECT id FROM sites WHERE client_id = %s AND name = %s', 
-                               (client_id, site_name))
-                    result = cur.fetchone()
-                    db_site_id = result[0] if result else None
-                
-                if not db_site_id:
-                    raise Exception(f"Failed to get or create site: {site_name}")
-
-                # Get or create probe
-                probe_address = probe_data.get('address', '')
-                if not probe_address:
-                    raise Exception("Missing probe address in data")
-                    
-                cur.execute('''
-                    INSERT INTO probes (site_id, probe_address)
-                    VALUES (%s, %s)
-                    ON CONFLICT (probe_address) DO NOTHING
-                    RETURNING id
-                ''', (db_site_id, probe_address))
-                
-                result = cur.fetchone()
-                if result:
-                    probe_id = result[0]
-                else:
-                    cur.execute('SELECT id FROM probes WHERE probe_address = %s', (probe_address,))
-                    result = cur.fetchone()
-                    probe_id = result[0] if result else None
-                
-                if not probe_id:
-                    raise Exception(f"Failed to get or create probe: {probe_address}")
-
-                # Process timestamp
-                datetime_str = probe_data.get('datetime', '')
-                if not datetime_str:
-                    raise Exception("Missing datetime in probe data")
-                    
+        CREATE INDEX CONCURRENTLY cannot run inside a transaction, so each table
+        gets its own autocommit connection; tables are indexed in parallel, the
+        indexes of one table one after another. A build that failed part way
+        leaves an INVALID index that IF NOT EXISTS would keep skipping, so such
+        indexes are dropped and built again. Only the process holding the index
+        advisory lock builds, which also keeps one from dropping an index that
+        another is still building.
+        """
+        def build(indexes):
+            with self.connection() as conn:
+                conn.autocommit = True
                 try:
-                    measurement_timestamp = datetime.strptime(datetime_str, '%Y-%m-%d %H:%M:%S')
-                except ValueError:
+                    with conn.cursor() as cur:
+                        for name, definition in indexes.items():
+                            cur.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} {definition}')
+                finally:
+                    conn.autocommit = False
+
+        with self.connection() as conn:
+            conn.autocommit = True
+            try:
+                with conn.cursor() as cur:
+                    # Waiting for the lock would hold a transaction open, which
+                    # CREATE INDEX CONCURRENTLY in turn waits on; a process that
+                    # finds it taken leaves the build to the one holding it
+                    cur.execute('SELECT pg_try_advisory_lock(%s)', (INDEX_LOCK_KEY,))
+                    if not cur.fetchone()[0]:
+                        return
                     try:
-                        # Try with dots between time components
-                        alt_datetime_str = datetime_str.replace('.', ':')
-                        measurement_timestamp = datetime.strptime(alt_datetime_str, '%Y-%m-%d %H:%M:%S')
-                    except ValueError as e:
-                        raise Exception(f"Invalid datetime format: {datetime_str}. Error: {str(e)}")
+                        cur.execute('''
+                            SELECT c.relname
+                            FROM pg_index i
+                            JOIN pg_class c ON c.oid = i.indexrelid
+                            WHERE NOT i.indisvalid AND c.relname = ANY(%s)
+                        ''', ([name for indexes in SECONDARY_INDEXES.values() for name in indexes],))
+                        for (name,) in cur.fetchall():
+                            cur.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
 
-                # Check if measurement already exists
-                cur.execute('''
-                    SELECT id FROM measurements 
-                    WHERE probe_id = %s AND timestamp = %s
-                ''', (probe_id, measurement_timestamp))
-                
-                existing_measurement = cur.fetchone()
-                
-                if existing_measurement:
-                    # Skip if the measurement already exists
-                    self.conn.commit()
-                    return
-                
-                # Default values for missing fields
-                probe_status = probe_data.get('probe_status', probe_data.get('status', 0))
-                if probe_status == '':
-                    probe_status = 0
-                    
-                alarm_status = probe_data.get('alarm_status', 0)
-                if alarm_status == '':
-                    alarm_status = 0
-                    
-                tank_status = probe_data.get('tank_status', 0)
-                if tank_status == '':
-                    tank_status = 0
-                    
-                ullage = probe_data.get('ullage', 0.0)
-                if ullage == '':
-                    ullage = 0.0
-                
-                # Make sure discriminator is never null or empty
-                discriminator = probe_data.get('discriminator')
-                if discriminator is None or discriminator == '':
-                    discriminator = 'N'
-                
-                # Insert the measurement
-                try:
-                    cur.execute('''
-                        INSERT INTO measurements 
-                        (probe_id, timestamp, status, product, water, density, discriminator, 
-                         temperatures, probe_status, alarm_status, tank_status, ullage)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    ''', (
-                        probe_id,
-                        measurement_timestamp,
-                        str(probe_status),
-                        float(probe_data.get('product', 0)),
-                        float(probe_data.get('water', 0)),
-                        float(probe_data.get('density', 0)),
-                        discriminator,
-                        json.dumps(probe_data.get('temperatures', [])),
-                        int(probe_status),
-                        int(alarm_status),
-                        int(tank_status),
-                        float(ullage)
-                    ))
-                    self.conn.commit()
-                except Exception as e:
-                    self.conn.rollback()
-                    raise Exception(f"Failed to insert measurement: {str(e)}")
-                    
-        except Exception as e:
+                        with ThreadPoolExecutor(max_workers=len(SECONDARY_INDEXES)) as executor:
+                            # Consume the results so a failed build is raised here
+                            list(executor.map(build, SECONDARY_INDEXES.values()))
+                    finally:
+                        cur.execute('SELECT pg_advisory_unlock(%s)', (INDEX_LOCK_KEY,))
+            finally:
+                conn.autocommit = False
+
+    def _get_or_create_probe_id(self, cur, probe_data: Dict) -> int:
+        """Resolve the probe id for a measurement, creating client, site and probe as needed"""
+        probe_id = self._probe_ids.get(probe_data.get('address', ''))
+        if probe_id is not None:
+            return probe_id
+
+        # Get or create client based on customer_id
+        customer_id = probe_data.get('customer_id', '0')
+        customer_name = f"Customer {customer_id}"
+        
+        cur.execute('''
+            INSERT INTO clients (name)
+            VALUES (%s)
+            ON CONFLICT (name) DO NOTHING
+            RETURNING id
+        ''', (customer_name,))
+        
+        result = cur.fetchone()
+        if result:
+            client_id = result[0]
+        else:
+            cur.execute('SELECT id FROM clients WHERE name = %s', (customer_name,))
+            result = cur.fetchone()
+            client_id = result[0] if result else None
+
+        if not client_id:
+            raise Exception(f"Failed to get or create client: {customer_name}")
+
+        # Get or create site based on site_id and client_id
+        site_id = probe_data.get('site_id', '0')
+        site_name = f"Site {site_id}"
+        
+        cur.execute('''
+            INSERT INTO sites (client_id, name)
+            VALUES (%s, %s)
+            ON CONFLICT (client_id, name) DO NOTHING
+            RETURNING id
+        ''', (client_id, site_name))
+        
+        result = cur.fetchone()
+        if result:
+            db_site_id = result[0]
+        else:
+            cur.execute('SELECT id FROM sites WHERE client_id = %s AND name = %s', 
+                       (client_id, site_name))
+            result = cur.fetchone()
+            db_site_id = result[0] if result else None
+        
+        if not db_site_id:
+            raise Exception(f"Failed to get or create site: {site_name}")
+
+        # Get or create probe
+        probe_address = probe_data.get('address', '')
+        if not probe_address:
+            raise Exception("Missing probe address in data")
+            
+        cur.execute('''
+            INSERT INTO probes (site_id, probe_address)
+            VALUES (%s, %s)
+            ON CONFLICT (probe_address) DO NOTHING
+            RETURNING id
+        ''', (db_site_id, probe_address))
+        
+        result = cur.fetchone()
+        if result:
+            probe_id = result[0]
+        else:
+            cur.execute('SELECT id FROM probes WHERE probe_address = %s', (probe_address,))
+            result = cur.fetchone()
+            probe_id = result[0] if result else None
+        
+        if not probe_id:
+            raise Exception(f"Failed to get or create probe: {probe_address}")
+
+        with self._probe_ids_lock:
+            self._probe_ids[probe_address] = probe_id
+        return probe_id
+
+    def _get_or_create_probe_ids(self, cur, rows: List[Dict]) -> Dict[str, int]:
+        """Resolve the probe ids for a batch of measurements, creating clients,
+        sites and probes with one insert and one select per table.
+
+        The first row seen for a probe address determines its client and site,
+        as with repeated calls to _get_or_create_probe_id. Addresses already in
+        the id cache are not looked up again.
+        """
+        addresses = {probe_data.get('address', '') for probe_data in rows}
+        with self._probe_ids_lock:
+            probe_ids = {address: self._probe_ids[address] for address in addresses if address in self._probe_ids}
+        probe_sites = {}
+        for probe_data in rows:
+            probe_address = probe_data.get('address', '')
+            if not probe_address:
+                raise Exception("Missing probe address in data")
+            if probe_address not in probe_sites and probe_address not in probe_ids:
+                probe_sites[probe_address] = (f"Customer {probe_data.get('customer_id', '0')}",
+                                              f"Site {probe_data.get('site_id', '0')}")
+
+        if not probe_sites:
+            return probe_ids
+
+        customer_names = list(dict.fromkeys(customer for customer, _ in probe_sites.values()))
+        execute_values(cur, 'INSERT INTO clients (name) VALUES %s ON CONFLICT (name) DO NOTHING',
+                       [(name,) for name in customer_names])
+        cur.execute('SELECT name, id FROM clients WHERE name = ANY(%s)', (customer_names,))
+        client_ids = dict(cur.fetchall())
+
+        site_keys = list(dict.fromkeys((client_ids[customer], site) for customer, site in probe_sites.values()))
+        execute_values(cur, 'INSERT INTO sites (client_id, name) VALUES %s ON CONFLICT (client_id, name) DO NOTHING',
+                       site_keys)
+        cur.execute('SELECT client_id, name, id FROM sites WHERE client_id = ANY(%s)',
+                    (list({client_id for client_id, _ in site_keys}),))
+        site_ids = {(client_id, name): site_id for client_id, name, site_id in cur.fetchall()}
+
+        execute_values(cur, 'INSERT INTO probes (site_id, probe_address) VALUES %s ON CONFLICT (probe_address) DO NOTHING',
+                       [(site_ids[(client_ids[customer], site)], probe_address)
+                        for probe_address, (customer, site) in probe_sites.items()])
+        cur.execute('SELECT probe_address, id FROM probes WHERE probe_address = ANY(%s)', (list(probe_sites),))
+        found = dict(cur.fetchall())
+        with self._probe_ids_lock:
+            self._probe_ids.update(found)
+        probe_ids.update(found)
+        return probe_ids
+
+    @staticmethod
+    def _parse_timestamp(datetime_str: str) -> datetime:
+        """Parse a measurement datetime, accepting dots between time components"""
+        if not datetime_str:
+            raise Exception("Missing datetime in probe data")
+
+        parsed = parse_datetime_fast(datetime_str)
+        if parsed is not None:
+            return parsed
+            
+        try:
+            return datetime.strptime(datetime_str, '%Y-%m-%d %H:%M:%S')
+        except ValueError:
             try:
-                self.conn.rollback()
-            except:
-                pass
+                # Try with dots between time components
+                alt_datetime_str = datetime_str.replace('.', ':')
+                return datetime.strptime(alt_datetime_str, '%Y-%m-%d %H:%M:%S')
+            except ValueError as e:
+                raise Exception(f"Invalid datetime format: {datetime_str}. Error: {str(e)}")
+
+    @staticmethod
+    def _measurement_values(probe_id: int, measurement_timestamp: datetime, probe_data: Dict) -> Tuple:
+        """Build the measurements row for a probe reading, filling in defaults for missing fields"""
+        # Default values for missing fields
+        probe_status = probe_data.get('probe_status', probe_data.get('status', 0))
+        if probe_status == '':
+            probe_status = 0
+            
+        alarm_status = probe_data.get('alarm_status', 0)
+        if alarm_status == '':
+            alarm_status = 0
+            
+        tank_status = probe_data.get('tank_status', 0)
+        if tank_status == '':
+            tank_status = 0
+            
+        ullage = probe_data.get('ullage', 0.0)
+        if ullage == '':
+            ullage = 0.0
+        
+        # Make sure discriminator is never null or empty
+        discriminator = probe_data.get('discriminator')
+        if discriminator is None or discriminator == '':
+            discriminator = 'N'
+
+        return (
+            probe_id,
+            measurement_timestamp,
+            str(probe_status),
+            float(probe_data.get('product', 0)),
+            float(probe_data.get('water', 0)),
+            float(probe_data.get('density', 0)),
+            discriminator,
+            orjson.dumps(probe_data.get('temperatures', [])).decode('utf-8'),
+            int(probe_status),
+            int(alarm_status),
+            int(tank_status),
+            float(ullage)
+        )
+
+    @_with_reconnect
+    def _fetch_all(self, query: str, params: Tuple = (), cursor_factory=RealDictCursor) -> List:
+        """Run a read-only query on a pooled connection and return all rows"""
+        with self.connection() as conn, conn.cursor(cursor_factory=cursor_factory) as cur:
+            cur.execute(query, params)
+            return cur.fetchall()
+
+    def _execute_save(self, cur, probe_data: Dict, measurement_timestamp: datetime) -> bool:
+        """Insert one measurement with the prepared statement; True if a row was written"""
+        probe_id = self._get_or_create_probe_id(cur, probe_data)
+        cur.execute(
+            'EXECUTE save_measurement (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)',
+            self._measurement_values(probe_id, measurement_timestamp, probe_data)
+        )
+        return cur.rowcount == 1
+
+    def _save_one(self, conn, cur, probe_data: Dict) -> bool:
+        """Insert and commit one measurement, rolling back and raising on failure"""
+        # Process timestamp
+        measurement_timestamp = self._parse_timestamp(probe_data.get('datetime', ''))
+
+        # Insert the measurement, skipping it if it is already stored
+        try:
+            conn.prepare(cur, 'save_measurement')
+            try:
+                inserted = self._execute_save(cur, probe_data, measurement_timestamp)
+            except psycopg2.errors.ForeignKeyViolation:
+                # A cached probe id was deleted; look the probe up again
+                conn.rollback()
+                with self._probe_ids_lock:
+                    self._probe_ids.clear()
+                inserted = self._execute_save(cur, probe_data, measurement_timestamp)
+            except psycopg2.errors.InvalidSqlStatementName:
+                # The session lost its prepared statements (e.g. DISCARD ALL)
+                # while the connection stayed open; prepare them again
+                conn.rollback()
+                conn.prepared.clear()
+                conn.prepare(cur, 'save_measurement')
+                inserted = self._execute_save(cur, probe_data, measurement_timestamp)
+            conn.commit()
+            return inserted
+        except psycopg2.errors.CheckViolation as e:
+            conn.rollback()
+            raise Exception(f"Measurement rejected by {e.diag.constraint_name}")
+        except Exception as e:
+            if conn.closed:
+                # The connection was lost; leave the retry to _with_reconnect
+                raise
+            conn.rollback()
+            raise Exception(f"Failed to insert measurement: {str(e)}")
+
+    @_with_reconnect
+    def _save_pooled(self, probe_data: Dict) -> bool:
+        """Save one measurement on a pooled connection, raising on failure"""
+        with self.connection() as conn, conn.cursor() as cur:
+            return self._save_one(conn, cur, probe_data)
+
+    def save_measurement(self, probe_data: Dict) -> Optional[bool]:
+        """Save a measurement to the database.
+
+        Returns True if the row was inserted, False if it was already stored,
+        and None if it could not be saved; the error is shown with st.error.
+        """
+        try:
+            return self._save_pooled(probe_data)
+        except Exception as e:
             st.error(f"Error saving measurement: {str(e)}")
             # Don't raise the exception here to avoid breaking the app flow
+            return None
+
+    def save_measurements_each(self, rows: List[Dict]) -> List[Optional[str]]:
+        """Save measurements one transaction at a time, for when a batch failed.
+
+        Returns the error message for each row, or None where the row was
+        stored (or already existed), so one bad reading fails only itself.
+        """
+        errors = []
+        for probe_data in rows:
+            try:
+                self._save_pooled(probe_data)
+                errors.append(None)
+            except Exception as e:
+                errors.append(str(e))
+        return errors
+
+    def _copy_measurements(self, cur, rows: List[Dict]):
+        """Stage rows with COPY and move the new ones into measurements"""
+        probe_ids = self._get_or_create_probe_ids(cur, rows)
+        values = []
+        for probe_data in rows:
+            measurement_timestamp = self._parse_timestamp(probe_data.get('datetime', ''))
+            values.append(self._measurement_values(probe_ids[probe_data.get('address', '')],
+                                                   measurement_timestamp, probe_data))
+
+        buffer = io.StringIO()
+        csv.writer(buffer, quoting=csv.QUOTE_ALL).writerows(values)
+        buffer.seek(0)
+
+        # The temporary table lives for the session, so pooled connections reuse it
+        cur.execute(f'''
+            CREATE TEMP TABLE IF NOT EXISTS measurements_staging
+            ON COMMIT DELETE ROWS
+            AS SELECT {MEASUREMENT_COLUMNS} FROM measurements WITH NO DATA
+        ''')
+        cur.copy_expert(
+            f'COPY measurements_staging ({MEASUREMENT_COLUMNS}) FROM STDIN WITH (FORMAT csv)',
+            buffer
+        )
+        cur.execute(f'''
+            INSERT INTO measurements ({MEASUREMENT_COLUMNS})
+            SELECT {MEASUREMENT_COLUMNS} FROM measurements_staging
+            ON CONFLICT (probe_id, timestamp) DO NOTHING
+        ''')
 
-    def get_measurement_history(self, probe_id: str, page: int = 1, per_page: int = 200) -> Tuple[List[Dict], int]:
-        """Get measurement history for a probe"""
+    def save_measurements_bulk(self, rows: List[Dict]):
+        """Save many measurements in a single transaction.
+
+        Rows are streamed with COPY into a session-local staging table and moved
+        into measurements with one INSERT ... SELECT, skipping measurements that
+        already exist. Unlike save_measurement, failures are raised; callers
+        can then retry the rows with save_measurements_each to find the bad ones.
+        """
+        if not rows:
+            return
         try:
-            self.ensure_connection()
-            offset = (page - 1) * per_page
-            with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
-                # Get total count for the specific probe
-                cur.execute('''
-                    SELECT COUNT(*) as count 
-                    FROM measurements m
-                    JOIN probes p ON m.probe_id = p.id
-                    WHERE p.probe_address = %s
-                ''', (probe_id,))
-                result = cur.fetchone()
-                total_records = result['count'] if result else 0
-
-                # Get paginated results for the specific probe
-                cur.execute('''
-                    SELECT 
-                        m.timestamp,
-                        p.probe_address,
-                        m.status,
-                        m.product,
-                        m.water,
-                        m.density,
-                        m.discriminator,
-                        m.probe_status,
-                        m.alarm_status,
-                        m.tank_status,
-                        m.ullage
-                    FROM measurements m
-                    JOIN probes p ON m.probe_id = p.id
-                    WHERE p.probe_address = %s
-                    ORDER BY m.timestamp DESC
-                    LIMIT %s OFFSET %s
-                ''', (probe_id, per_page, offset))
-                records = cur.fetchall()
-
-                return list(records), total_records
+            self._save_bulk_pooled(rows)
+        except Exception as e:
+            raise Exception(f"Failed to insert measurements: {str(e)}")
+
+    @_with_reconnect
+    def _save_bulk_pooled(self, rows: List[Dict]):
+        """Copy and commit a batch of measurements on a pooled connection"""
+        with self.connection() as conn, conn.cursor() as cur:
+            try:
+                self._copy_measurements(cur, rows)
+            except psycopg2.errors.ForeignKeyViolation:
+                # A cached probe id was deleted; look the probes up again
+                conn.rollback()
+                with self._probe_ids_lock:
+                    self._probe_ids.clear()
+                self._copy_measurements(cur, rows)
+            conn.commit()
+
+    def get_measurement_history(self, probe_id: str, per_page: int = 200,
+                                cursor: Optional[datetime] = None) -> Tuple[List[MeasurementRow], Optional[datetime]]:
+        """Get one page of measurement history for a probe, newest first.
+
+        Pages are addressed by keyset instead of OFFSET: cursor is the timestamp
+        of the last row of the previous page (None for the first page). Returns
+        the records and the cursor for the next page, or None if this is the last.
+        Timestamps are unique per probe, so they identify rows on their own.
+        Records are MeasurementRow tuples rather than dicts, with numeric
+        columns as floats, so a page loads into a DataFrame cheaply.
+        """
+        try:
+            # Fetch one extra row to know whether another page follows
+            records = self._fetch_all('''
+                SELECT 
+                    m.timestamp,
+                    p.probe_address,
+                    m.status,
+                    m.product::float8 AS product,
+                    m.water::float8 AS water,
+                    m.density::float8 AS density,
+                    m.discriminator,
+                    m.probe_status,
+                    m.alarm_status,
+                    m.tank_status,
+                    m.ullage::float8 AS ullage
+                FROM measurements m
+                JOIN probes p ON m.probe_id = p.id
+                WHERE p.probe_address = %s
+                  AND (%s::timestamp IS NULL OR m.timestamp < %s::timestamp)
+                ORDER BY m.timestamp DESC
+                LIMIT %s
+            ''', (probe_id, cursor, cursor, per_page + 1), cursor_factory=None)
+            records = [MeasurementRow(*record) for record in records]
+
+            if len(records) > per_page:
+                records = records[:per_page]
+                return records, records[-1].timestamp
+            return records, None
         except Exception as e:
             st.error(f"Error fetching measurement history: {str(e)}")
-            return [], 0
+            return [], None
             
     def get_all_clients(self):
         """Get all clients from the database"""
         try:
-            self.ensure_connection()
-            with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute('''
-                    SELECT id, name 
-                    FROM clients
-                    ORDER BY name
-                ''')
-                return cur.fetchall()
+            return self._fetch_all('''
+                SELECT id, name 
+                FROM clients
+                ORDER BY name
+            ''')
         except Exception as e:
             st.error(f"Error fetching clients: {str(e)}")
             return []
@@ -378,15 +781,12 @@ class Database:
     def get_sites_for_client(self, client_id):
         """Get all sites for a specific client"""
         try:
-            self.ensure_connection()
-            with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute('''
-                    SELECT id, name 
-                    FROM sites
-                    WHERE client_id = %s
-                    ORDER BY name
-                ''', (client_id,))
-                return cur.fetchall()
+            return self._fetch_all('''
+                SELECT id, name 
+                FROM sites
+                WHERE client_id = %s
+                ORDER BY name
+            ''', (client_id,))
         except Exception as e:
             st.error(f"Error fetching sites: {str(e)}")
             return []
@@ -394,15 +794,12 @@ class Database:
     def get_probes_for_site(self, site_id):
         """Get all probes for a specific site"""
         try:
-            self.ensure_connection()
-            with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute('''
-                    SELECT id, probe_address 
-                    FROM probes
-                    WHERE site_id = %s
-                    ORDER BY probe_address
-                ''', (site_id,))
-                return cur.fetchall()
+            return self._fetch_all('''
+                SELECT id, probe_address 
+                FROM probes
+                WHERE site_id = %s
+                ORDER BY probe_address
+            ''', (site_id,))
         except Exception as e:
             st.error(f"Error fetching probes: {str(e)}")
             return []
@@ -410,23 +807,11 @@ class Database:
     def get_latest_measurements_for_site(self, site_id):
         """Get the latest measurement for each probe in a site"""
         try:
-            self.ensure_connection()
-            with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute('''
-                    WITH latest_measurements AS (
-                        SELECT 
-                            m.probe_id,
-                            MAX(m.timestamp) as latest_timestamp
-                        FROM 
-                            measurements m
-                            JOIN probes p ON m.probe_id = p.id
-                            JOIN sites s ON p.site_id = s.id
-                        WHERE 
-                            s.id = %s
-                        GROUP BY 
-                            m.probe_id
-                    )
-                    SELECT 
+            # DISTINCT ON keeps the newest row per probe in a single pass
+            return self._fetch_all('''
+                SELECT *
+                FROM (
+                    SELECT DISTINCT ON (m.probe_id)
                         p.probe_address,
                         m.timestamp,
                         m.product,
@@ -438,13 +823,16 @@ class Database:
                         m.ullage,
                         m.temperatures
                     FROM 
-                        latest_measurements lm
-                        JOIN measurements m ON lm.probe_id = m.probe_id AND lm.latest_timestamp = m.timestamp
+                        measurements m
                         JOIN probes p ON m.probe_id = p.id
+                    WHERE 
+                        p.site_id = %s
                     ORDER BY 
-                        p.probe_address
-                ''', (site_id,))
-                return cur.fetchall()
+                        m.probe_id, m.timestamp DESC
+                ) latest
+                ORDER BY 
+                    probe_address
+            ''', (site_id,))
         except Exception as e:
             st.error(f"Error fetching latest measurements: {str(e)}")
             return []
\ No newline at end of file
@@ -0,0 +1,147 @@
+import math
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+from lxml import etree
+
+from src.xml_parser import XMLParser, XMLStructureError
+from src.data_validator import VALID_DISCRIMINATORS
+
+# Number of probe readings validated together while a file is parsed
+CHUNK_SIZE = 5_000
+
+def apply_defaults(probe_data: Dict) -> Dict:
+    """Fill in the values the database requires but the XML may leave empty"""
+    # Make sure discriminator is never empty
+    if not probe_data.get('discriminator'):
+        probe_data['discriminator'] = 'N'
+        
+    # Ensure customer_id and site_id values are valid
+    if not probe_data.get('customer_id') or probe_data.get('customer_id') == '':
+        probe_data['customer_id'] = '999'
+        
+    if not probe_data.get('site_id') or probe_data.get('site_id') == '':
+        probe_data['site_id'] = '999'
+
+    return probe_data
+
+def _int_or_nan(value) -> float:
+    """int(value), or NaN where int() raises"""
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        return math.nan
+
+def _float_or_nan(value) -> float:
+    """float(value), or NaN where float() raises"""
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return math.nan
+
+def _float_values(values: pd.Series) -> np.ndarray:
+    """float() of each value, NaN where it raises. Plain ASCII decimals are
+    converted in one go, the rest (underscores, other digits, non-strings)
+    by float() itself"""
+    is_plain = values.astype(str).str.fullmatch(
+        r'[ \t]*[+-]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][+-]?[0-9]+)?[ \t]*').to_numpy(dtype=bool)
+    numbers = np.empty(len(values))
+    numbers[is_plain] = values[is_plain].to_numpy().astype(float)
+    numbers[~is_plain] = values[~is_plain].map(_float_or_nan).to_numpy(dtype=float)
+    return numbers
+
+def validate_frame(df: pd.DataFrame) -> np.ndarray:
+    """Validate many probe readings at once.
+
+    Returns a boolean mask marking the rows validate_probe_data would accept.
+    Expects the columns produced by XMLParser, with defaults already applied.
+    """
+    def int_values(column: str) -> pd.Series:
+        # Values int() would accept; anything else becomes NaN. Plain ASCII
+        # integers are converted in one go, the rest (underscores, other
+        # digits, non-strings) by int() itself
+        values = df[column].where(df[column] != '', '0')
+        is_int = values.astype(str).str.fullmatch(r'[ \t]*[+-]?[0-9]+[ \t]*')
+        numbers = pd.to_numeric(values.where(is_int), errors='coerce').astype(object)
+        rest = ~is_int.to_numpy(dtype=bool)
+        numbers[rest] = values[rest].map(_int_or_nan)
+        return pd.to_numeric(numbers)
+
+    def decimal_ok(column: str, max_int: int, max_dec: int) -> np.ndarray:
+        # str(float) has at most max_int integer characters (sign included)
+        # and max_dec decimals
+        values = _float_values(df[column])
+        with np.errstate(invalid='ignore'):
+            return ((values > -(10 ** (max_int - 1))) & (values < 10 ** max_int)
+                    & (np.round(values, max_dec) == values))
+
+    # ProbeStatus validation (max 2 digits)
+    probe_status = int_values('probe_status')
+    mask = (probe_status >= 0).to_numpy() & (probe_status <= 99).to_numpy()
+
+    # AlarmStatus and TankStatus are only rejected when they parse as out of range
+    mask &= ~(int_values('alarm_status') < 0).to_numpy()
+    tank_status = int_values('tank_status')
+    mask &= ~((tank_status < 0) | (tank_status > 99)).to_numpy()
+
+    # Ullage, product and water (5 integers + 2 decimals), density (4 integers + 2 decimals)
+    mask &= decimal_ok('ullage', 5, 2)
+    mask &= decimal_ok('product', 5, 2)
+    mask &= decimal_ok('water', 5, 2)
+    mask &= decimal_ok('density', 4, 2)
+
+    # Discriminator validation
+    mask &= df['discriminator'].isin(VALID_DISCRIMINATORS).to_numpy()
+
+    # DateTime validation; dots between time components are accepted
+    datetimes = pd.to_datetime(df['datetime'].astype(str).str.replace('.', ':', regex=False),
+                               format='%Y-%m-%d %H:%M:%S', errors='coerce')
+    mask &= (datetimes.notna() & df['datetime'].astype(bool)).to_numpy()
+
+    # Temperature validation (1 decimal, range -30° to 80°)
+    temperatures = df['temperatures'].explode()
+    temp_values = _float_values(temperatures)
+    with np.errstate(invalid='ignore'):
+        temp_ok = ((temp_values >= -30) & (temp_values <= 80)
+                   & (np.round(temp_values, 1) == temp_values))
+    # Rows without temperatures explode to a single NaN and are valid
+    temp_ok |= temperatures.isna().to_numpy() & df['temperatures'].map(len).eq(0).reindex(temperatures.index).to_numpy()
+    mask &= pd.Series(temp_ok, index=temperatures.index).groupby(level=0).all().reindex(df.index).to_numpy()
+
+    return mask
+
+def validate_chunk(probe_data_list: List[Dict]) -> List[Dict]:
+    """Apply defaults to a chunk of probe readings and keep the valid ones"""
+    # object dtype keeps the parsed values (and None) exactly as the XML parser produced them
+    df = pd.DataFrame(probe_data_list, dtype=object)
+    df['discriminator'] = df['discriminator'].replace('', 'N').fillna('N')
+    df[['customer_id', 'site_id']] = df[['customer_id', 'site_id']].replace('', '999').fillna('999')
+
+    return df[validate_frame(df)].to_dict('records')
+
+def process_file(file_path: str) -> Tuple[int, List[Dict]]:
+    """Parse and validate one XML file.
+
+    Returns the number of probe readings found and the valid ones. Readings
+    are validated in chunks of CHUNK_SIZE as the file is parsed, so a large
+    file is never held in full as raw readings. Kept at module level so it
+    can run in a ProcessPoolExecutor worker.
+    """
+    probe_count = 0
+    valid_rows = []
+    chunk = []
+    try:
+        for probe_data in XMLParser.iter_parse_xml_file(file_path):
+            probe_count += 1
+            chunk.append(probe_data)
+            if len(chunk) >= CHUNK_SIZE:
+                valid_rows.extend(validate_chunk(chunk))
+                chunk.clear()
+        if chunk:
+            valid_rows.extend(validate_chunk(chunk))
+    except (etree.XMLSyntaxError, XMLStructureError, OSError):
+        # A file that fails to parse contributes nothing, as with parse_xml_file;
+        # other errors are bugs and are raised
+        return 0, []
+    return probe_count, valid_rows
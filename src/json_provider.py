@@ -0,0 +1,24 @@
+from typing import Any
+
+import orjson
+from flask.json.provider import DefaultJSONProvider
+
+class ORJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that encodes and decodes with orjson"""
+
+    def _options(self) -> int:
+        return orjson.OPT_SORT_KEYS if self.sort_keys else 0
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return orjson.dumps(obj, default=self.default, option=self._options()).decode('utf-8')
+
+    def loads(self, s: str | bytes, **kwargs: Any) -> Any:
+        return orjson.loads(s)
+
+    def response(self, *args: Any, **kwargs: Any):
+        """Build a JSON response straight from orjson's bytes output"""
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=self._options()),
+            mimetype=self.mimetype
+        )
@@ -97,7 +97,7 @@ def render_measurements(probe_data):
     with col3:
         st.metric("Density", f"{float(probe_data['density']):.2f} kg/m³")
 
-def render_measurement_history(records, total_records, page: int = 1, per_page: int = 200):
+def render_measurement_history(records, next_cursor=None, page: int = 1):
     st.subheader("Measurement History")
 
     if not records:
@@ -168,36 +168,32 @@ def render_measurement_history(records, total_records, page: int = 1, per_page:
     # Apply column renaming
     df = df[list(available_columns.keys())].rename(columns=available_columns)
 
-    # Display table with pagination info
-    st.dataframe(df, use_container_width=True)
-
-    # Pagination controls
-    total_pages = (total_records + per_page - 1) // per_page
+    # Display table with pagination info; measurements keep their two decimals
+    st.dataframe(df, use_container_width=True, column_config={
+        name: st.column_config.NumberColumn(format="%.2f")
+        for key, name in available_columns.items() if key in ('product', 'water', 'density', 'ullage')
+    })
 
+    # Pagination controls; pages are walked by cursor, so only neighbours are reachable
     col1, col2, col3 = st.columns([1, 3, 1])
     with col2:
-        st.markdown(f"Page {page} of {total_pages} (Total records: {total_records})")
+        st.markdown(f"Page {page}")
 
-    col1, col2, col3, col4 = st.columns([1, 1, 1, 1])
+    col1, col2, col3 = st.columns([1, 1, 1])
     with col1:
         if page > 1:
             if st.button("⏮️ First"):
-                st.session_state.history_page = 1
+                st.session_state.history_cursors = []
                 st.rerun()
     with col2:
         if page > 1:
             if st.button("◀️ Previous"):
-                st.session_state.history_page = page - 1
+                st.session_state.history_cursors.pop()
                 st.rerun()
     with col3:
-        if page < total_pages:
+        if next_cursor is not None:
             if st.button("Next ▶️"):
-                st.session_state.history_page = page + 1
-                st.rerun()
-    with col4:
-        if page < total_pages:
-            if st.button("Last ⏭️"):
-                st.session_state.history_page = total_pages
+                st.session_state.history_cursors.append(next_cursor)
                 st.rerun()
 
 def render_error_messages(errors):
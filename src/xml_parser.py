@@ -1,93 +1,300 @@
-import xml.etree.ElementTree as ET
+import re
+from functools import lru_cache
+from io import BytesIO
+from lxml import etree as ET
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
 import streamlit as st
 
+class XMLStructureError(ValueError):
+    """Raised when a probe XML document lacks the Site or Probe elements, or
+    holds a temperature that is not a number"""
+
 class XMLParser:
+    # Compiled once; smart_strings=False returns plain str instead of lxml's smart strings
+    _TEMPERATURES = ET.XPath('Temperatures[1]/Temperature/text()', smart_strings=False)
+
+    # Patterns for the regex fast path over the known flat probe layout
+    # '<!' covers comments, CDATA and DOCTYPE; ']]>' is not allowed in text, and
+    # '\xef\xbf' leads the UTF-8 of U+FFFE and U+FFFF, which XML does not allow
+    _FAST_UNSUPPORTED = (b'<!', b'&', b'<?xml-stylesheet', b']]>', b'\xef\xbf')
+    _FAST_DECLARATION = re.compile(rb'\A(?:\xef\xbb\xbf)?<\?xml[^>]*encoding=["\']([\w.-]+)["\']')
+    # Block bodies are matched as runs of text and tags up to the closing tag,
+    # which avoids the per-character backtracking of a lazy '.*?'
+    _FAST_SITE = re.compile(r'<Site>([^<]*(?:<(?!/Site>)[^<]*)*)</Site>')
+    _FAST_PROBE = re.compile(r'<Probe>([^<]*(?:<(?!/Probe>)[^<]*)*)</Probe>')
+    _FAST_BLOCK_TAG = re.compile(r'<(?:Site|Probe)[\s/>]')
+    _FAST_TEMPERATURES = re.compile(r'<Temperatures>([^<]*(?:<(?!/Temperatures>)[^<]*)*)</Temperatures>|<Temperatures\s*/>')
+    _FAST_TEMPERATURE = re.compile(r'<Temperature>([^<\r]*)</Temperature>')
+    _FAST_FIELD = re.compile(r'<([^\W\d]\w*)>([^<\r]*)</\1>|<([^\W\d]\w*)\s*/>')
+    # Control characters XML does not allow
+    _FAST_CONTROL_BYTES = bytes(byte for byte in range(32) if byte not in b'\t\n\r')
+
     @staticmethod
     def parse_xml_file(file_path: str) -> Optional[List[Dict]]:
         try:
             # Parse XML file
-            tree = ET.parse(file_path)
-            root = tree.getroot()
+            return XMLParser._parse_stream(file_path)
+        except Exception as e:
+            st.error(f"Error parsing XML file: {str(e)}")
+            return None
 
-            # Get site information
-            site = root.find('.//Site')
-            if site is None:
-                st.error("No Site element found in XML")
-                return None
+    @staticmethod
+    def parse_xml_bytes(data: bytes) -> Optional[List[Dict]]:
+        """Parse XML received in memory; the encoding is taken from the XML declaration"""
+        try:
+            return XMLParser._parse_stream(BytesIO(data))
+        except Exception as e:
+            st.error(f"Error parsing XML data: {str(e)}")
+            return None
+
+    @staticmethod
+    def parse_xml_stream(stream) -> Optional[List[Dict]]:
+        """Parse XML from a readable stream, such as a request body, while it is being read"""
+        try:
+            return XMLParser._parse_stream(stream)
+        except Exception as e:
+            st.error(f"Error parsing XML data: {str(e)}")
+            return None
 
-            site_info = {
-                'server_id': site.find('ServerID').text if site.find('ServerID') is not None else '',
-                'distributor_id': site.find('DistributorID').text if site.find('DistributorID') is not None else '',
-                'customer_id': site.find('CustomerID').text if site.find('CustomerID') is not None else '',
-                'site_id': site.find('SiteID').text if site.find('SiteID') is not None else ''
-            }
-
-            # Find all probes
-            probes = root.findall('.//Probe')
-            if not probes:
-                st.error("No Probe elements found in XML")
+    @staticmethod
+    def parse_xml_fast(data: bytes) -> Optional[List[Dict]]:
+        """Parse the flat Alisonic layout with regular expressions.
+
+        Returns None whenever the document uses anything outside that layout
+        (comments, CDATA, entities, attributes, other encodings, unexpected
+        markup), in which case the caller should fall back to parse_xml_bytes.
+        """
+        if (any(marker in data for marker in XMLParser._FAST_UNSUPPORTED)
+                or len(data.translate(None, XMLParser._FAST_CONTROL_BYTES)) != len(data)):
+            return None
+        declaration = XMLParser._FAST_DECLARATION.match(data)
+        if declaration and declaration.group(1).lower() not in (b'utf-8', b'utf8', b'us-ascii', b'ascii'):
+            return None
+        try:
+            text = data.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            return None
+
+        # Every Site and Probe tag must be a plain one captured by the patterns
+        site = XMLParser._FAST_SITE.search(text)
+        probe_matches = list(XMLParser._FAST_PROBE.finditer(text))
+        if (site is None or not probe_matches
+                or probe_matches[0].start() < site.end()
+                or len(XMLParser._FAST_BLOCK_TAG.findall(text)) != len(probe_matches) + text.count('<Site>')):
+            return None
+
+        # The blocks are checked field by field below; the markup around them
+        # must still nest into a single root element
+        skeleton = [text[:site.start()]]
+        position = site.end()
+        for match in probe_matches:
+            skeleton.append(text[position:match.start()])
+            position = match.end()
+        skeleton.append(text[position:])
+        if not XMLParser._fast_well_formed(''.join(skeleton)):
+            return None
+        probes = [match.group(1) for match in probe_matches]
+
+        site_fields = XMLParser._fast_fields(site.group(1))
+        if site_fields is None:
+            return None
+        site_info = XMLParser._site_fields(site_fields)
+
+        probe_data_list = []
+        for body in probes:
+            temp_values = None
+            for temperatures in XMLParser._FAST_TEMPERATURES.finditer(body):
+                temp_body = temperatures.group(1) or ''
+                temp_texts = XMLParser._FAST_TEMPERATURE.findall(temp_body)
+                if temp_body.count('<') != 2 * len(temp_texts):
+                    return None
+                # Only the first Temperatures element is read
+                if temp_values is None:
+                    try:
+                        temp_values = [float(temp) for temp in temp_texts if temp]
+                    except ValueError:
+                        return None
+            if temp_values is not None:
+                body = XMLParser._FAST_TEMPERATURES.sub('', body)
+            fields = XMLParser._fast_fields(body)
+            if fields is None:
                 return None
+            probe_data_list.append(XMLParser._probe_fields(fields, temp_values or [], site_info))
+        return probe_data_list
 
-            probe_data_list = []
-            for probe in probes:
-                # Parse temperatures
-                temperatures = probe.find('Temperatures')
-                temp_values = []
-                if temperatures is not None:
-                    temp_values = [float(temp.text) for temp in temperatures.findall('Temperature') if temp.text]
-
-                # Format datetime (replace '.' with ':' for database compatibility)
-                datetime_str = probe.find('DateTime').text if probe.find('DateTime') is not None else ''
-                if datetime_str:
-                    # Replace all dots with colons in the time part for consistent format
-                    datetime_str = datetime_str.replace('.', ':')
-
-                # Create probe data dictionary
-                # Get Status from old format or ProbeStatus from new format
-                status_value = '0'
-                status_node = probe.find('Status')
-                probe_status_node = probe.find('ProbeStatus')
-                
-                if probe_status_node is not None and probe_status_node.text:
-                    status_value = probe_status_node.text
-                elif status_node is not None and status_node.text:
-                    status_value = status_node.text
-                
-                # Get site info - support missing values
-                customer_id = site_info.get('customer_id', '1')
-                site_id = site_info.get('site_id', '1')
-                
-                # For files with missing SiteID, use a default consistent value
-                if not site_id or site_id.strip() == '':
-                    site_id = '999'  # Default site ID for files without site information
-                    
-                if not customer_id or customer_id.strip() == '':
-                    customer_id = '999'  # Default customer ID for files without customer information
-                
-                probe_data = {
-                    'server_id': site_info.get('server_id', ''),
-                    'distributor_id': site_info.get('distributor_id', ''),
-                    'customer_id': customer_id,
-                    'site_id': site_id,
-                    'address': probe.find('Address').text if probe.find('Address') is not None else '',
-                    'status': status_value,
-                    'probe_status': probe_status_node.text if probe_status_node is not None else status_value,
-                    'alarm_status': probe.find('AlarmStatus').text if probe.find('AlarmStatus') is not None else '0',
-                    'tank_status': probe.find('TankStatus').text if probe.find('TankStatus') is not None else '0',
-                    'datetime': datetime_str,
-                    'ullage': probe.find('Ullage').text if probe.find('Ullage') is not None else '0.0',
-                    'product': probe.find('Product').text if probe.find('Product') is not None else '0.0',
-                    'water': probe.find('Water').text if probe.find('Water') is not None else '0.0',
-                    'density': probe.find('Density').text if probe.find('Density') is not None else '0.0',
-                    'phs': probe.find('Phs').text if probe.find('Phs') is not None else '',
-                    'discriminator': probe.find('Discriminator').text if probe.find('Discriminator') is not None and probe.find('Discriminator').text else 'N',
-                    'temperatures': temp_values
-                }
-                probe_data_list.append(probe_data)
-
-            return probe_data_list
-        except Exception as e:
-            st.error(f"Error parsing XML file: {str(e)}")
-            return None
\ No newline at end of file
+    @staticmethod
+    @lru_cache(maxsize=256)
+    def _fast_well_formed(skeleton: str) -> bool:
+        """Check the markup outside the Site and Probe blocks with lxml, which is
+        cheap as little is left: it must be well formed and declare no default
+        namespace, which would hide the blocks from the lxml path's lookups.
+        A sender's documents share one skeleton, so results are cached"""
+        try:
+            root = ET.fromstring(skeleton.encode('utf-8'))
+        except ET.XMLSyntaxError:
+            return False
+        return not any(None in element.nsmap for element in root.iter())
+
+    @staticmethod
+    def _fast_fields(body: str) -> Optional[Dict]:
+        """Map the leaf elements of a block to their text, or None if it holds any other markup.
+        As with lxml's find(), the first occurrence of a tag wins"""
+        matches = XMLParser._FAST_FIELD.findall(body)
+        empty_count = sum(1 for _, _, empty_tag in matches if empty_tag) if '/>' in body else 0
+        # Each paired field accounts for two '<', each empty one for a single '<'
+        if body.count('<') != 2 * len(matches) - empty_count:
+            return None
+        return {tag or empty_tag: value or None for tag, value, empty_tag in reversed(matches)}
+
+    @staticmethod
+    def iter_parse_xml_file(file_path: str) -> Iterator[Dict]:
+        """Yield the file's probe readings one at a time as they are parsed.
+
+        Unlike parse_xml_file, errors are raised to the caller; a file without
+        Site or Probe elements, or with an unreadable temperature, raises
+        XMLStructureError.
+        """
+        return XMLParser._iter_stream(file_path)
+
+    @staticmethod
+    def _parse_stream(source) -> Optional[List[Dict]]:
+        try:
+            return list(XMLParser._iter_stream(source))
+        except XMLStructureError as e:
+            st.error(str(e))
+            return None
+
+    @staticmethod
+    def _iter_stream(source) -> Iterator[Dict]:
+        """Parse Site and Probe elements as they are read, so only one probe
+        subtree is held in memory at a time.
+
+        As with a lookup over the whole tree, the Site is the first one in
+        document order and probes are returned in the order they start, wherever
+        they sit. Probes that end before the Site is known, or inside another
+        probe, are held back until they can be returned in that order.
+        """
+        site = None
+        site_info = None
+        # Fields and temperatures of each probe in start order, None while it is
+        # open; those before next_probe have been returned
+        probes = []
+        next_probe = 0
+        # Site and Probe elements not yet ended, with the probe's index in probes
+        open_blocks = []
+        found_probe = False
+        for event, elem in ET.iterparse(source, events=('start', 'end'), tag=('Site', 'Probe'),
+                                        huge_tree=False, remove_blank_text=True):
+            # The root element is not a Site or Probe of its own document
+            if elem.getparent() is None:
+                continue
+            if event == 'start':
+                if elem.tag == 'Probe':
+                    open_blocks.append(len(probes))
+                    probes.append(None)
+                else:
+                    if site is None:
+                        site = elem
+                    open_blocks.append(None)
+                continue
+
+            index = open_blocks.pop()
+            if index is not None:
+                probes[index] = XMLParser._probe_parts(elem)
+            elif elem is site:
+                site_info = XMLParser._site_info(elem)
+
+            # Drop the element and the siblings parsed before it, unless an
+            # enclosing Site or Probe still has to be read
+            if not open_blocks:
+                elem.clear()
+                while elem.getprevious() is not None:
+                    del elem.getparent()[0]
+
+            if site_info is not None:
+                while next_probe < len(probes) and probes[next_probe] is not None:
+                    fields, temp_values = probes[next_probe]
+                    next_probe += 1
+                    found_probe = True
+                    yield XMLParser._probe_fields(fields, temp_values, site_info)
+                if next_probe == len(probes):
+                    probes.clear()
+                    next_probe = 0
+
+        if site_info is None:
+            raise XMLStructureError("No Site element found in XML")
+        if not found_probe:
+            raise XMLStructureError("No Probe elements found in XML")
+
+    @staticmethod
+    def _child_texts(elem) -> Dict:
+        """Map each child tag to its text in one pass; the first occurrence of a tag wins"""
+        return {child.tag: child.text for child in reversed(elem)}
+
+    @staticmethod
+    def _site_info(site) -> Dict:
+        return XMLParser._site_fields(XMLParser._child_texts(site))
+
+    @staticmethod
+    def _site_fields(fields: Dict) -> Dict:
+        return {
+            'server_id': fields.get('ServerID', ''),
+            'distributor_id': fields.get('DistributorID', ''),
+            'customer_id': fields.get('CustomerID', ''),
+            'site_id': fields.get('SiteID', '')
+        }
+
+    @staticmethod
+    def _probe_parts(probe) -> Tuple[Dict, List[float]]:
+        """The child texts and temperatures _probe_fields builds a reading from"""
+        try:
+            temp_values = [float(temp) for temp in XMLParser._TEMPERATURES(probe)]
+        except ValueError as e:
+            raise XMLStructureError(f"Invalid temperature in XML: {e}")
+        return XMLParser._child_texts(probe), temp_values
+
+    @staticmethod
+    def _probe_fields(fields: Dict, temp_values: List[float], site_info: Dict) -> Dict:
+
+        # Format datetime (replace '.' with ':' for database compatibility)
+        datetime_str = fields.get('DateTime', '')
+        if datetime_str:
+            # Replace all dots with colons in the time part for consistent format
+            datetime_str = datetime_str.replace('.', ':')
+
+        # Create probe data dictionary
+        # Get Status from old format or ProbeStatus from new format
+        status_value = fields.get('ProbeStatus') or fields.get('Status') or '0'
+        
+        # Get site info - support missing values
+        customer_id = site_info.get('customer_id', '1')
+        site_id = site_info.get('site_id', '1')
+        
+        # For files with missing SiteID, use a default consistent value
+        if not site_id or site_id.strip() == '':
+            site_id = '999'  # Default site ID for files without site information
+            
+        if not customer_id or customer_id.strip() == '':
+            customer_id = '999'  # Default customer ID for files without customer information
+        
+        probe_data = {
+            'server_id': site_info.get('server_id', ''),
+            'distributor_id': site_info.get('distributor_id', ''),
+            'customer_id': customer_id,
+            'site_id': site_id,
+            'address': fields.get('Address', ''),
+            'status': status_value,
+            'probe_status': fields['ProbeStatus'] if 'ProbeStatus' in fields else status_value,
+            'alarm_status': fields.get('AlarmStatus', '0'),
+            'tank_status': fields.get('TankStatus', '0'),
+            'datetime': datetime_str,
+            'ullage': fields.get('Ullage', '0.0'),
+            'product': fields.get('Product', '0.0'),
+            'water': fields.get('Water', '0.0'),
+            'density': fields.get('Density', '0.0'),
+            'phs': fields.get('Phs', ''),
+            'discriminator': fields.get('Discriminator') or 'N',
+            'temperatures': temp_values
+        }
+        return probe_data